@@ -0,0 +1,35 @@
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from backend.models import AccessRequestModel
+import datetime
+
+# Statuses an admin can set on a request
+ACCESS_REQUEST_STATUSES = ("approved", "rejected", "pending")
+
+
+async def create_access_request(db: AsyncSession, name: str, email: str, reason: str = ""):
+    """Store a new pending access request (commits) and return it"""
+    request = AccessRequestModel(name=name, email=email, reason=reason or "")
+    db.add(request)
+    await db.commit()
+    return request
+
+
+async def list_access_requests(db: AsyncSession):
+    """All access requests, newest first"""
+    result = await db.execute(
+        select(AccessRequestModel)
+        .order_by(AccessRequestModel.submitted_at.desc(), AccessRequestModel.id.desc())
+    )
+    return result.scalars().all()
+
+
+async def set_access_request_status(db: AsyncSession, request_id: int, status: str):
+    """Record an admin's decision (commits). Returns False if there is no such request."""
+    result = await db.execute(
+        update(AccessRequestModel)
+        .where(AccessRequestModel.id == request_id)
+        .values(status=status, reviewed_at=datetime.datetime.utcnow())
+    )
+    await db.commit()
+    return result.rowcount > 0
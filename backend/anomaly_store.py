@@ -0,0 +1,106 @@
+from sqlalchemy import insert, update
+from sqlalchemy.orm import Session
+from backend.models import AnomalyModel
+import datetime
+
+# Users scoring at or above this have an open anomaly
+ANOMALY_THRESHOLD = 60
+
+# The first permission found here decides which system an anomaly is reported against
+PERMISSION_SYSTEMS = {
+    "view_salaries": "HR System",
+    "db_admin": "Database",
+    "process_payments": "Finance Portal",
+    "deploy_code": "CI/CD System"
+}
+
+
+def anomaly_severity(risk_score):
+    return "High" if risk_score < 80 else "Critical"
+
+
+def detected_system(permissions):
+    for perm in permissions or []:
+        if perm in PERMISSION_SYSTEMS:
+            return PERMISSION_SYSTEMS[perm]
+    return "Multiple Systems"
+
+
+def _anomaly_fields(user, entry):
+    return {
+        "username": user.username,
+        "description": f"High risk detected: {entry.get('reason', 'Unknown risk factors')}",
+        "severity": anomaly_severity(entry["risk_score"]),
+        "system": detected_system(user.accumulated_permissions),
+        "risk_score": entry["risk_score"]
+    }
+
+
+# =============== SYNC ===============
+# Plain rows rather than entities, since the updates below bypass the session
+_OPEN_COLUMNS = (
+    AnomalyModel.id, AnomalyModel.user_id, AnomalyModel.username, AnomalyModel.description,
+    AnomalyModel.severity, AnomalyModel.system, AnomalyModel.risk_score
+)
+
+
+def sync_anomalies(db: Session, users, result):
+    """Open, refresh or resolve anomalies to match a full scoring run (does not commit).
+
+    Returns the (opened, resolved) anomalies for change notifications.
+    """
+    open_rows = db.query(*_OPEN_COLUMNS).filter(AnomalyModel.resolved_at.is_(None)).all()
+    return _sync(db, users, result, open_rows, full=True)
+
+
+def sync_user_anomalies(db: Session, users, result):
+    """Open, refresh or resolve the anomalies of users scored incrementally (does not commit)"""
+    open_rows = db.query(*_OPEN_COLUMNS).filter(
+        AnomalyModel.user_id.in_([user.id for user in users]), AnomalyModel.resolved_at.is_(None)
+    ).all()
+    return _sync(db, users, result, open_rows)
+
+
+def _sync(db: Session, users, result, open_rows, full=False):
+    now = datetime.datetime.utcnow()
+    open_by_user = {row.user_id: row for row in open_rows}
+
+    opened, refreshed, resolved, resolved_rows = [], [], [], []
+    if full:
+        # A full run scores every user, so open anomalies outside it belong
+        # to users that no longer exist (their ids may be handed out again)
+        for row in open_rows:
+            if row.user_id not in result:
+                resolved.append({"id": row.id, "resolved_at": now, "updated_at": now})
+                resolved_rows.append(row)
+    for user in users:
+        entry = result.get(user.id)
+        if entry is None:
+            continue
+        current = open_by_user.get(user.id)
+        if current is not None and current.username != user.username:
+            # Left behind by a deleted user whose id was reused
+            resolved.append({"id": current.id, "resolved_at": now, "updated_at": now})
+            resolved_rows.append(current)
+            current = None
+
+        if entry["risk_score"] >= ANOMALY_THRESHOLD:
+            fields = _anomaly_fields(user, entry)
+            if current is None:
+                opened.append(dict(fields, user_id=user.id, detected_at=now, updated_at=now))
+            # Unchanged anomalies are left alone so updated_at means something
+            elif any(getattr(current, key) != value for key, value in fields.items()):
+                refreshed.append(dict(fields, id=current.id, updated_at=now))
+        elif current is not None:
+            resolved.append({"id": current.id, "resolved_at": now, "updated_at": now})
+            resolved_rows.append(current)
+
+    if opened:
+        db.execute(insert(AnomalyModel), opened)
+    if refreshed:
+        db.execute(update(AnomalyModel), refreshed)
+    if resolved:
+        db.execute(update(AnomalyModel), resolved)
+
+    # Opened rows (as inserted, without ids yet) and the open rows just resolved
+    return opened, resolved_rows
@@ -0,0 +1,63 @@
+from backend.database import SessionLocal
+import csv
+import io
+import os
+import zlib
+
+# Rows fetched from the database, and written to the client, per chunk
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "1000"))
+
+
+# =============== FORMATTING ===============
+def csv_chunks(rows, chunk_size=EXPORT_CHUNK_SIZE):
+    """Format rows as CSV text, yielding a chunk every chunk_size rows.
+
+    One small buffer is reused, so memory does not grow with the row count.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    pending = 0
+    for row in rows:
+        writer.writerow(row)
+        pending += 1
+        if pending >= chunk_size:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def gzip_chunks(chunks):
+    """Gzip a stream of text chunks on the fly"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def encode_chunks(chunks, gzip=False):
+    """Bytes for a StreamingResponse, gzipped if asked"""
+    if gzip:
+        return gzip_chunks(chunks)
+    return (chunk.encode("utf-8") for chunk in chunks)
+
+
+# =============== QUERIES ===============
+def stream_query(stmt, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield the rows of a select chunk by chunk, in a session of its own.
+
+    The session outlives the request handler (the response is still being
+    sent), so it is opened and closed here. The read runs in one
+    transaction, so the export is a consistent snapshot.
+    """
+    db = SessionLocal()
+    try:
+        result = db.execute(stmt.execution_options(yield_per=chunk_size))
+        for partition in result.partitions():
+            yield from partition
+    finally:
+        db.close()
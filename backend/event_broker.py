@@ -0,0 +1,120 @@
+from collections import deque
+import asyncio
+import itertools
+import json
+import os
+import threading
+import time
+import uuid
+
+# Recent events kept for subscribers that reconnect with a last-seen id
+EVENT_BUFFER_SIZE = int(os.getenv("EVENT_BUFFER_SIZE", "5000"))
+
+# Idle streams get a comment line this often so proxies keep them open
+EVENT_HEARTBEAT_SECONDS = float(os.getenv("EVENT_HEARTBEAT_SECONDS", "15"))
+
+# Scoring runs that change more users than this send one "rescored"
+# event instead of a delta per user
+EVENT_MAX_USER_DELTAS = int(os.getenv("EVENT_MAX_USER_DELTAS", "500"))
+
+
+class EventBroker:
+    """In-process fan-out of change events to any number of stream subscribers.
+
+    Events are numbered and kept in a bounded ring buffer. Subscribers do
+    not get a queue each: they remember the last sequence number they sent
+    and are woken to read on from the shared buffer, so a slow client
+    never holds events for everyone else. Ids carry a per-process epoch, so
+    a client resuming against a restarted server is told to reload.
+    Publishing is thread-safe (writes and refits commit outside the event
+    loop).
+    """
+
+    def __init__(self, buffer_size=EVENT_BUFFER_SIZE):
+        self.epoch = uuid.uuid4().hex[:8]
+        self._events = deque(maxlen=buffer_size)
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._subscribers = set()
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def publish(self, event_type, data):
+        """Number an event, buffer it and wake every subscriber"""
+        with self._lock:
+            self._seq += 1
+            self._events.append((self._seq, event_type, data))
+            subscribers = list(self._subscribers)
+        for loop, wake in subscribers:
+            try:
+                loop.call_soon_threadsafe(wake.set)
+            except RuntimeError:
+                # The subscriber's loop is gone; it unsubscribes itself
+                pass
+
+    def parse_event_id(self, event_id):
+        """Sequence number to resume after, or None if the id is not from this process"""
+        if not event_id:
+            return 0
+        epoch, _, seq = event_id.partition("-")
+        if epoch != self.epoch or not seq.isdigit() or int(seq) > self._seq:
+            return None
+        return int(seq)
+
+    def _read_after(self, seq):
+        """Buffered events after seq, or None if some of them were already dropped"""
+        with self._lock:
+            if not self._events or seq >= self._seq:
+                return []
+            first = self._events[0][0]
+            if seq < first - 1:
+                return None
+            return list(itertools.islice(self._events, seq - first + 1, None))
+
+    async def stream(self, last_event_id=None, heartbeat=EVENT_HEARTBEAT_SECONDS):
+        """Server-Sent Events text for one subscriber, resuming after last_event_id"""
+        loop = asyncio.get_running_loop()
+        wake = asyncio.Event()
+        subscriber = (loop, wake)
+        self._subscribers.add(subscriber)
+        try:
+            seq = self.parse_event_id(last_event_id)
+            if seq is None:
+                # Resume point unknown here: start from now and tell the client
+                seq = self._seq
+                yield self._format(seq, "reset", {"reason": "unknown_event_id"})
+            yield "retry: 3000\n\n"
+
+            last_heartbeat = time.monotonic()
+            while True:
+                events = self._read_after(seq)
+                if events is None:
+                    # Fell behind the buffer: the client has to reload
+                    seq = self._seq
+                    yield self._format(seq, "reset", {"reason": "buffer_overrun"})
+                    continue
+                for event_seq, event_type, data in events:
+                    seq = event_seq
+                    yield self._format(event_seq, event_type, data)
+
+                wake.clear()
+                # Events may have landed between the read and the clear
+                if self._seq > seq:
+                    continue
+                timeout = heartbeat - (time.monotonic() - last_heartbeat)
+                try:
+                    await asyncio.wait_for(wake.wait(), max(timeout, 0))
+                except asyncio.TimeoutError:
+                    last_heartbeat = time.monotonic()
+                    yield ": keep-alive\n\n"
+        finally:
+            self._subscribers.discard(subscriber)
+
+    def _format(self, seq, event_type, data):
+        payload = json.dumps(data, separators=(",", ":"), default=str)
+        return f"id: {self.epoch}-{seq}\nevent: {event_type}\ndata: {payload}\n\n"
+
+
+event_broker = EventBroker()
@@ -1,30 +1,69 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import StreamingResponse
+from sqlalchemy import case, func, select, true
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from backend.database import SessionLocal, init_db, get_db
-from backend.models import UserPermissionModel
+from backend.database import (
+    SessionLocal, async_engine, init_db, get_db, get_async_db, bump_data_version, get_cache_validators
+)
+from backend.models import UserPermissionModel, AnomalyModel
+from backend.access_request_store import (
+    create_access_request, list_access_requests, set_access_request_status, ACCESS_REQUEST_STATUSES
+)
+from backend.permission_store import (
+    set_user_permissions, set_users_permissions, users_with_permission, permission_holder_counts,
+    permission_events_since, latest_event_seq, permissions_at
+)
+from backend.role_catalog import get_role_catalog
+from backend.role_ingest import ingest_role_changes, recalculate_after_ingest, INGEST_BATCH_SIZE
+from backend.event_broker import event_broker
+from backend.serialization import (
+    CompressionMiddleware, FastJSONResponse, json_response, parse_fields, shape_rows
+)
+from backend.csv_export import csv_chunks, encode_chunks, stream_query
+from backend.pagination import keyset_page, keyset_select, next_page, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from backend.risk_engine import (
+    calculate_risk_scores, get_risk_scores, get_permission_prevalence, load_risk_model,
+    score_user, score_users, risk_service, risk_snapshot_age, shutdown_risk_pool,
+    risk_tier, RARE_PERMISSION_THRESHOLD, RISK_DANGER_THRESHOLD
+)
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
 import json
-from datetime import datetime, timedelta
-import pandas as pd
-from sklearn.ensemble import IsolationForest
-import io
-import csv
+from datetime import datetime, timedelta, timezone
 import random
 # Add these imports
 import secrets
 from typing import Optional
 from datetime import datetime, timedelta
-import sqlite3
 import hashlib
 import uuid
+from contextlib import asynccontextmanager
+from email.utils import format_datetime, parsedate_to_datetime
 
 # Initialize the database tables on start
 init_db()
 
-app = FastAPI()
+# Reuse the last fitted risk model instead of fitting on the first request
+load_risk_model()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Compile roles before any request holds a write transaction (they are interned in their own)
+    get_role_catalog()
+    # Refits run on the background service; readers get the last table meanwhile
+    risk_service.start()
+    yield
+    risk_service.stop()
+    shutdown_risk_pool()
+    await async_engine.dispose()
+
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
+
+# Compress large responses (event streams are left alone)
+app.add_middleware(CompressionMiddleware, skip_paths=["/api/events/stream"])
 
 # Add CORS middleware for frontend
 app.add_middleware(
@@ -36,8 +75,59 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Risk-Scores-Age", "X-Risk-Scores-Refitting", "X-Next-Cursor", "ETag", "Last-Modified"],
 )
 
+@app.middleware("http")
+async def add_risk_freshness_headers(request: Request, call_next):
+    """Tell clients how old the risk table behind a read is"""
+    response = await call_next(request)
+    age = risk_snapshot_age()
+    if request.method == "GET" and age is not None:
+        response.headers["X-Risk-Scores-Age"] = f"{age:.1f}"
+        response.headers["X-Risk-Scores-Refitting"] = "true" if risk_service.refitting else "false"
+    return response
+
+# =============== CONDITIONAL GET ===============
+def _etag_matches(if_none_match, etag):
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison, as If-None-Match calls for
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return etag in (tag[2:] if tag.startswith("W/") else tag for tag in tags)
+
+def _not_modified_since(if_modified_since, last_modified):
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since is None or last_modified is None:
+        return False
+    if since.tzinfo is not None:
+        since = since.astimezone(timezone.utc).replace(tzinfo=None)
+    return last_modified.replace(microsecond=0) <= since
+
+async def conditional_get(request: Request, response: Response):
+    """ETag/Last-Modified for reads that only change with the data or scores version.
+
+    A request whose validators still match gets a 304 before the endpoint
+    runs, so it costs no query (the versions are cached) and no scoring.
+    """
+    etag, last_modified = await get_cache_validators()
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(last_modified.replace(tzinfo=timezone.utc), usegmt=True)
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        not_modified = _etag_matches(if_none_match, etag)
+    else:
+        not_modified = _not_modified_since(request.headers.get("if-modified-since"), last_modified)
+    if not_modified:
+        raise HTTPException(status_code=304, headers=headers)
+
+    response.headers.update(headers)
+
 # =============== EXISTING ENDPOINTS ===============
 class RoleChange(BaseModel):
     username: str
@@ -69,22 +159,113 @@ def update_role(data: RoleChange, db: Session = Depends(get_db)):
     existing_perms = user.accumulated_permissions or []
     updated_perms = list(set(existing_perms + data.new_permissions))
     
-    # 3. Save back to PostgreSQL 
+    # 3. Save back to PostgreSQL (only the new grants are inserted)
     user.current_role = data.new_role
-    user.accumulated_permissions = updated_perms
+    set_user_permissions(db, user, updated_perms, source="update-role")
+    bump_data_version(db)
     db.commit()
     
+    # 4. Score just this user against the current model
+    risk = score_user(db, user)
+    
     return {
         "status": "Success",
         "user": user.username,
         "new_role": user.current_role,
-        "total_permissions": updated_perms
+        "total_permissions": updated_perms,
+        "risk_score": risk["risk_score"]
     }
 
-@app.get("/audit-data")
-def get_audit_data(db: Session = Depends(get_db)):
+# =============== BULK ROLE CHANGES ===============
+NDJSON_CONTENT_TYPES = {"application/x-ndjson", "application/ndjson", "application/jsonl"}
+
+async def role_change_records(request: Request):
+    """Yield the raw records of a bulk body: a JSON array, or NDJSON read line by line as it streams in"""
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type not in NDJSON_CONTENT_TYPES:
+        try:
+            records = await request.json()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON")
+        if not isinstance(records, list):
+            raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON")
+        for record in records:
+            yield record
+        return
+
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield line
+    if buffer.strip():
+        yield buffer
+
+def parse_role_change(record):
+    """One bulk record (parsed JSON or an NDJSON line) as a RoleChange (ValueError/TypeError if invalid)"""
+    if isinstance(record, bytes):
+        record = json.loads(record)
+    if not isinstance(record, dict):
+        raise TypeError("Record must be a JSON object")
+    return RoleChange(**record)
+
+@app.post("/update-role/bulk")
+async def bulk_update_roles(request: Request):
+    """Apply many role changes with /update-role's creep semantics.
+
+    Takes a JSON array or an NDJSON stream of RoleChange records. They are
+    upserted INGEST_BATCH_SIZE at a time, one transaction per batch, and
+    risk scores are recalculated once after the last batch.
+    """
+    results = []
+    batch = []
+
+    async def flush():
+        changes = [change for _, change in batch]
+        applied = await run_in_threadpool(ingest_role_changes, changes)
+        results.extend(dict(result, index=index) for (index, _), result in zip(batch, applied))
+        batch.clear()
+
+    index = 0
+    async for record in role_change_records(request):
+        try:
+            batch.append((index, parse_role_change(record)))
+        except (ValueError, TypeError) as e:
+            results.append({"index": index, "status": "error", "error": str(e)})
+        index += 1
+        if len(batch) >= INGEST_BATCH_SIZE:
+            await flush()
+    if batch:
+        await flush()
+
+    results.sort(key=lambda result: result["index"])
+    totals = {status: 0 for status in ("created", "updated", "unchanged", "error")}
+    for result in results:
+        totals[result["status"]] += 1
+
+    # Deferred to the end of the load rather than run per record
+    risk = "skipped"
+    if totals["created"] or totals["updated"]:
+        risk = await run_in_threadpool(recalculate_after_ingest)
+
+    return {
+        "status": "Success" if not totals["error"] else "Partial",
+        "received": index,
+        "totals": totals,
+        "risk_recalculation": risk,
+        "results": results
+    }
+
+@app.get("/audit-data", dependencies=[Depends(conditional_get)])
+def get_audit_data(response: Response, fields: Optional[str] = None,
+                   response_format: str = Query("rows", alias="format"), db: Session = Depends(get_db)):
     # This endpoint provides the raw data for Person 2's AI Engine [cite: 177]
-    return db.query(UserPermissionModel).all()
+    # Plain column rows, encoded directly (?fields= and ?format=columnar as for /api/users)
+    columns = UserPermissionModel.__table__.columns
+    rows = [dict(row) for row in db.execute(select(*columns).order_by(UserPermissionModel.id)).mappings()]
+    return json_response(list_payload(rows, fields, response_format, tuple(columns.keys())), response)
 
 # Create a way to actually FIX the problem
 class RemediationRequest(BaseModel):
@@ -123,6 +304,10 @@ class FilterCriteria(BaseModel):
     maxRisk: Optional[int] = None
     status: Optional[str] = None
     role: Optional[str] = None
+    sortBy: Optional[str] = None  # a USER_SORT_COLUMNS key
+    sortOrder: Optional[str] = "asc"
+    cursor: Optional[str] = None
+    limit: Optional[int] = None
 
 class ReportType(BaseModel):
     type: str = "monthly"
@@ -150,144 +335,191 @@ class AccessRequestResponse(BaseModel):
     timestamp: str
     error: Optional[str] = None
 # =============== EXISTING FRONTEND ENDPOINTS ===============
-@app.get("/api/users", response_model=List[UserResponse])
-def get_users_for_frontend(db: Session = Depends(get_db)):
-    """Get users in frontend format with calculated risk scores"""
-    users = db.query(UserPermissionModel).all()
-    
-    # Calculate risk scores using AI model
-    risk_data = calculate_risk_scores(db)
-    
-    result = []
-    for user in users:
-        # Get risk score from AI calculation
-        user_risk = risk_data.get(user.id, {"risk_score": 0, "status": "low"})
-        
-        # Determine status based on risk
-        risk_score = user_risk.get("risk_score", 0)
-        if risk_score >= 80:
-            status = "critical"
-        elif risk_score >= 60:
-            status = "high"
-        elif risk_score >= 40:
-            status = "medium"
-        else:
-            status = "low"
-        
-        # Calculate time since last update
-        if user.last_updated:
-            time_diff = datetime.utcnow() - user.last_updated
-            if time_diff.days == 0:
-                if time_diff.seconds < 3600:
-                    last_change = f"{time_diff.seconds // 60} minutes ago"
-                else:
-                    last_change = f"{time_diff.seconds // 3600} hours ago"
-            elif time_diff.days == 1:
-                last_change = "yesterday"
-            else:
-                last_change = f"{time_diff.days} days ago"
-        else:
-            last_change = "never"
-        
-        # Calculate excess permissions
-        excess_perms = 0
-        if user.accumulated_permissions:
-            # Simplified: count permissions not in current role's typical set
-            role_permissions = {
-                "HR": ["view_salaries", "edit_profiles", "onboard_users"],
-                "Developer": ["access_github", "deploy_code", "read_logs"],
-                "Finance": ["process_payments", "view_tax_data", "approve_expenses"],
-                "DevOps": ["db_admin", "server_root", "manage_cloud"]
-            }
-            expected = role_permissions.get(user.current_role, [])
-            excess_perms = len([p for p in user.accumulated_permissions if p not in expected])
-        
-        result.append(UserResponse(
-            id=user.id,
-            name=user.username,
-            role=user.current_role,
-            department=user.current_role,  # Using role as department for now
-            riskScore=risk_score,
-            permissions=len(user.accumulated_permissions) if user.accumulated_permissions else 0,
-            excessPermissions=excess_perms,
-            lastChange=last_change,
-            status=status
-        ))
-    
-    return result
+# Sort keys for the user list; id, riskScore, name and lastUpdated are index-backed
+USER_SORT_COLUMNS = {
+    "id": UserPermissionModel.id,
+    "riskScore": UserPermissionModel.risk_score,
+    "name": UserPermissionModel.username,
+    "lastUpdated": UserPermissionModel.last_updated,
+    "excessPermissions": UserPermissionModel.excess_permissions,
+    "lastScored": UserPermissionModel.last_scored_at
+}
 
-@app.get("/api/stats", response_model=StatsResponse)
-def get_dashboard_stats(db: Session = Depends(get_db)):
-    """Get dashboard statistics"""
-    users = db.query(UserPermissionModel).all()
-    
-    # Calculate risk scores
-    risk_data = calculate_risk_scores(db)
-    
-    # Count high risk users (risk >= 60)
-    high_risk_count = sum(1 for user_id, data in risk_data.items() 
-                         if data.get("risk_score", 0) >= 60)
-    
-    # Calculate compliance score (inverse of average risk)
-    if risk_data:
-        avg_risk = sum(data.get("risk_score", 0) for data in risk_data.values()) / len(risk_data)
-        compliance_score = max(0, 100 - avg_risk)
-    else:
-        compliance_score = 100
-    
-    # Count anomalies (users with status "⚠️ DANGER" from AI)
-    anomalies_count = sum(1 for data in risk_data.values() 
-                         if data.get("status") == "⚠️ DANGER")
-    
+async def user_page(db: AsyncSession, response: Response, stmt, sort_by, sort_order, cursor, limit):
+    """Fetch one keyset page of users and put the next cursor in X-Next-Cursor"""
+    sort_by = sort_by or "id"
+    if sort_by not in USER_SORT_COLUMNS:
+        raise HTTPException(status_code=400, detail=f"Unknown sort key: {sort_by}")
+    try:
+        users, next_cursor = await keyset_page(
+            db, stmt, sort_by, USER_SORT_COLUMNS[sort_by], UserPermissionModel.id,
+            descending=sort_order == "desc", cursor=cursor, limit=limit
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return users
+
+def time_ago(timestamp):
+    """Human-readable age of a UTC timestamp ("5 minutes ago", "yesterday", ...)"""
+    if not timestamp:
+        return "never"
+    time_diff = datetime.utcnow() - timestamp
+    if time_diff.days == 0:
+        if time_diff.seconds < 3600:
+            return f"{time_diff.seconds // 60} minutes ago"
+        return f"{time_diff.seconds // 3600} hours ago"
+    if time_diff.days == 1:
+        return "yesterday"
+    return f"{time_diff.days} days ago"
+
+def user_response(user: UserPermissionModel):
+    """Frontend row for a user (a UserResponse as a plain dict), from the stored risk columns"""
+    return {
+        "id": user.id,
+        "name": user.username,
+        "role": user.current_role,
+        "department": user.current_role,  # Using role as department for now
+        "riskScore": float(user.risk_score or 0),
+        "permissions": len(user.accumulated_permissions) if user.accumulated_permissions else 0,
+        "excessPermissions": user.excess_permissions or 0,
+        "lastChange": time_ago(user.last_updated),
+        "status": user.risk_tier or "low"
+    }
+
+# Fields a user list can be projected onto with ?fields=
+USER_FIELDS = tuple(UserResponse.__annotations__)
+
+def list_payload(rows, fields, response_format, allowed):
+    """Apply ?fields= and ?format= to a list of row dicts (400 for bad values)"""
+    try:
+        return shape_rows(rows, parse_fields(fields, allowed), response_format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/users", response_model=List[UserResponse], dependencies=[Depends(conditional_get)])
+async def get_users_for_frontend(response: Response, cursor: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE,
+                                 sortBy: str = "id", sortOrder: str = "asc", fields: Optional[str] = None,
+                                 response_format: str = Query("rows", alias="format"),
+                                 db: AsyncSession = Depends(get_async_db)):
+    """Get one page of users in frontend format (the next cursor is in X-Next-Cursor).
+
+    ?fields=name,riskScore trims each row and ?format=columnar returns one
+    array per field. Rows are encoded directly, without per-row models.
+    """
+    users = await user_page(db, response, select(UserPermissionModel), sortBy, sortOrder, cursor, limit)
+    rows = [user_response(user) for user in users]
+    return json_response(list_payload(rows, fields, response_format, USER_FIELDS), response)
+
+@app.get("/api/stats", response_model=StatsResponse, dependencies=[Depends(conditional_get)])
+async def get_dashboard_stats(db: AsyncSession = Depends(get_async_db)):
+    """Get dashboard statistics (the same counters /api/dashboard sends)"""
+    counters = (await db.execute(select(dashboard_stats()))).one()
+    return stats_response(counters)
+
+def anomaly_response(anomaly: AnomalyModel):
+    """Frontend row for a stored anomaly (an AnomalyResponse as a plain dict)"""
+    return {
+        "id": anomaly.id,
+        "user": anomaly.username,
+        "description": anomaly.description,
+        "severity": anomaly.severity,
+        "time": time_ago(anomaly.detected_at),
+        "system": anomaly.system
+    }
+
+# Fields an anomaly list can be projected onto with ?fields=
+ANOMALY_FIELDS = tuple(AnomalyResponse.__annotations__)
+
+def open_anomalies():
+    """Select anomalies that are still open (the scoring pipeline resolves the rest)"""
+    return select(AnomalyModel).where(AnomalyModel.resolved_at.is_(None))
+
+def flagged_anomalies(ordered=True):
+    """Select open anomalies the model flags as DANGER, riskiest first (unordered for keyset pages)"""
+    stmt = open_anomalies().where(AnomalyModel.risk_score > RISK_DANGER_THRESHOLD)
+    if ordered:
+        stmt = stmt.order_by(AnomalyModel.risk_score.desc(), AnomalyModel.id)
+    return stmt
+
+@app.get("/api/anomalies", response_model=List[AnomalyResponse], dependencies=[Depends(conditional_get)])
+async def get_anomalies(db: AsyncSession = Depends(get_async_db)):
+    """Get AI-detected anomalies (open ones the model flags as DANGER)"""
+    anomalies = (await db.execute(flagged_anomalies())).scalars().all()
+    return [anomaly_response(anomaly) for anomaly in anomalies]
+
+# =============== DASHBOARD ===============
+# Open anomalies sent with the dashboard snapshot
+DASHBOARD_ANOMALY_LIMIT = 20
+
+def dashboard_stats():
+    """Select the dashboard counters from the stored risk columns as a one-row subquery"""
+    scored = UserPermissionModel.last_scored_at.isnot(None)
+    return select(
+        func.count(UserPermissionModel.id).label("total_users"),
+        func.coalesce(func.sum(case((UserPermissionModel.risk_score >= 60, 1), else_=0)), 0).label("high_risk_users"),
+        func.coalesce(func.sum(case((UserPermissionModel.risk_score > RISK_DANGER_THRESHOLD, 1), else_=0)), 0)
+        .label("anomalies_detected"),
+        # Users not scored yet have no score to average
+        func.avg(case((scored, UserPermissionModel.risk_score))).label("avg_risk")
+    ).subquery()
+
+def stats_response(counters):
+    """StatsResponse from a dashboard_stats() row (compliance is the inverse of the average risk)"""
+    avg_risk = counters.avg_risk
     return StatsResponse(
-        total_users=len(users),
-        high_risk_users=high_risk_count,
-        anomalies_detected=anomalies_count,
-        compliance_score=round(compliance_score, 1)
+        total_users=counters.total_users,
+        high_risk_users=counters.high_risk_users,
+        anomalies_detected=counters.anomalies_detected,
+        compliance_score=round(max(0, 100 - avg_risk) if avg_risk is not None else 100, 1)
     )
 
-@app.get("/api/anomalies", response_model=List[AnomalyResponse])
-def get_anomalies(db: Session = Depends(get_db)):
-    """Get AI-detected anomalies"""
-    risk_data = calculate_risk_scores(db)
-    users = db.query(UserPermissionModel).all()
-    
-    anomalies = []
-    anomaly_id = 1
-    
-    for user in users:
-        user_risk = risk_data.get(user.id, {})
-        
-        if user_risk.get("status") == "⚠️ DANGER":
-            # Create anomaly description based on risk reason
-            reason = user_risk.get("reason", "Unknown risk factors")
-            
-            # Determine system based on permissions
-            systems = {
-                "view_salaries": "HR System",
-                "db_admin": "Database",
-                "process_payments": "Finance Portal",
-                "deploy_code": "CI/CD System"
-            }
-            
-            detected_system = "Multiple Systems"
-            if user.accumulated_permissions:
-                for perm in user.accumulated_permissions:
-                    if perm in systems:
-                        detected_system = systems[perm]
-                        break
-            
-            anomalies.append(AnomalyResponse(
-                id=anomaly_id,
-                user=user.username,
-                description=f"High risk detected: {reason}",
-                severity="High" if user_risk.get("risk_score", 0) < 80 else "Critical",
-                time="Recent",
-                system=detected_system
-            ))
-            anomaly_id += 1
-    
-    return anomalies
+@app.get("/api/dashboard", dependencies=[Depends(conditional_get)])
+async def get_dashboard(limit: int = DEFAULT_PAGE_SIZE, anomalyLimit: int = DASHBOARD_ANOMALY_LIMIT,
+                        db: AsyncSession = Depends(get_async_db)):
+    """Get the stats, first page of users and top anomalies for one dashboard load.
+
+    Everything comes from the stored results of the last scoring run: the
+    counters ride along with the user page in a single query, and the
+    anomalies come from the table that run kept in sync.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    stats = dashboard_stats()
+    stmt = keyset_select(
+        select(UserPermissionModel, stats).join(stats, true()),
+        "id", UserPermissionModel.id, UserPermissionModel.id, False, None, limit
+    )
+    rows = (await db.execute(stmt)).all()
+    users, next_cursor = next_page(
+        [row[0] for row in rows], limit, "id", UserPermissionModel.id, UserPermissionModel.id, False
+    )
+
+    if rows:
+        counters = rows[0]
+    else:
+        # No users: the subquery row is lost in the join, so read it on its own
+        counters = (await db.execute(select(stats))).one()
+
+    # Ordered as /api/anomalies/all?flagged=true sorts by default, so its cursor continues the list
+    anomalies, anomalies_cursor = [], None
+    if anomalyLimit > 0:
+        anomaly_limit = min(anomalyLimit, MAX_PAGE_SIZE)
+        anomaly_rows = (await db.execute(keyset_select(
+            flagged_anomalies(ordered=False), "riskScore", AnomalyModel.risk_score, AnomalyModel.id,
+            True, None, anomaly_limit
+        ))).scalars().all()
+        anomalies, anomalies_cursor = next_page(
+            anomaly_rows, anomaly_limit, "riskScore", AnomalyModel.risk_score, AnomalyModel.id, True
+        )
+
+    return {
+        "stats": stats_response(counters),
+        "users": [user_response(user) for user in users],
+        "next_cursor": next_cursor,
+        "anomalies": [anomaly_response(anomaly) for anomaly in anomalies],
+        "anomalies_next_cursor": anomalies_cursor
+    }
 
 @app.post("/api/calculate-risks")
 def trigger_risk_calculation(db: Session = Depends(get_db)):
@@ -295,6 +527,111 @@ def trigger_risk_calculation(db: Session = Depends(get_db)):
     risk_data = calculate_risk_scores(db, update_db=True)
     return {"message": "Risk scores updated", "users_processed": len(risk_data)}
 
+@app.get("/api/permissions", dependencies=[Depends(conditional_get)])
+async def get_permission_catalog(db: AsyncSession = Depends(get_async_db)):
+    """Get every catalog permission with how many users hold it"""
+    counts = await permission_holder_counts(db)
+    return {
+        "permissions": [{"name": name, "users": users} for name, users in counts],
+        "total": len(counts)
+    }
+
+@app.get("/api/permissions/{permission}/users", dependencies=[Depends(conditional_get)])
+async def get_permission_holders(permission: str, db: AsyncSession = Depends(get_async_db)):
+    """Get the users who hold a permission"""
+    users = await users_with_permission(db, permission)
+    return {
+        "permission": permission,
+        "users": [{"id": user.id, "name": user.username, "role": user.current_role} for user in users],
+        "count": len(users)
+    }
+
+@app.get("/api/permissions/prevalence", dependencies=[Depends(conditional_get)])
+def get_permissions_prevalence(db: Session = Depends(get_db)):
+    """Get the share of users holding each permission (rarest first)"""
+    prevalence = get_permission_prevalence(db)
+    return {
+        "permissions": prevalence,
+        "rare_threshold": RARE_PERMISSION_THRESHOLD,
+        "total": len(prevalence)
+    }
+
+
+# =============== PERMISSION EVENTS ===============
+def permission_event_response(event):
+    return {
+        "seq": event.seq,
+        "user_id": event.user_id,
+        "user": event.username,
+        "action": event.action,
+        "permission": event.permission,
+        "role": event.role,
+        "source": event.source,
+        "timestamp": event.created_at.isoformat()
+    }
+
+@app.get("/api/permission-events", dependencies=[Depends(conditional_get)])
+async def get_permission_events(since: int = 0, limit: int = DEFAULT_PAGE_SIZE, username: Optional[str] = None,
+                                db: AsyncSession = Depends(get_async_db)):
+    """Get grant/revoke events after sequence number `since`, oldest first.
+
+    Pass the returned last_seq back as `since` to read the next batch.
+    """
+    user = None
+    if username is not None:
+        user = (await db.execute(
+            select(UserPermissionModel).where(UserPermissionModel.username == username)
+        )).scalar_one_or_none()
+        if user is None:
+            raise HTTPException(status_code=404, detail="User not found")
+
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    events = await permission_events_since(db, since, limit, user)
+    return {
+        "events": [permission_event_response(event) for event in events],
+        "last_seq": events[-1].seq if events else since,
+        "latest_seq": await latest_event_seq(db)
+    }
+
+@app.get("/api/users/{username}/permissions", dependencies=[Depends(conditional_get)])
+async def get_user_permissions_at(username: str, at: Optional[datetime] = None, seq: Optional[int] = None,
+                                  db: AsyncSession = Depends(get_async_db)):
+    """Get a user's permissions now, at a past time (`at`) or right after event `seq`"""
+    user = (await db.execute(
+        select(UserPermissionModel).where(UserPermissionModel.username == username)
+    )).scalar_one_or_none()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    # Timestamps are stored as naive UTC
+    if at is not None and at.tzinfo is not None:
+        at = at.astimezone(timezone.utc).replace(tzinfo=None)
+
+    permissions = await permissions_at(db, user, at, seq)
+    return {
+        "user": user.username,
+        "at": at.isoformat() if at else None,
+        "seq": seq,
+        "permissions": permissions,
+        "total": len(permissions)
+    }
+
+
+# =============== CHANGE STREAM ===============
+@app.get("/api/events/stream")
+async def stream_changes(request: Request, last_event_id: Optional[str] = None):
+    """Server-Sent Events feed of committed risk score and anomaly changes.
+
+    EventSource sends Last-Event-ID when it reconnects; a fresh connection
+    can resume with ?last_event_id= instead. A "reset" event means the
+    resume point is gone and the client should reload.
+    """
+    resume_from = request.headers.get("last-event-id") or last_event_id
+    return StreamingResponse(
+        event_broker.stream(resume_from),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 # =============== AUTHENTICATION ENDPOINTS ===============
 
@@ -351,7 +688,7 @@ async def admin_login(login_data: AdminLoginRequest):
         )
 
 @app.post("/api/request-access", response_model=AccessRequestResponse)
-async def request_access(request_data: AccessRequest, db: Session = Depends(get_db)):
+async def request_access(request_data: AccessRequest, db: AsyncSession = Depends(get_async_db)):
     """Submit access request"""
     try:
         if not request_data.name or not request_data.email:
@@ -370,35 +707,11 @@ async def request_access(request_data: AccessRequest, db: Session = Depends(get_
         print(f"   Timestamp: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
         print("   " + "="*50)
         
-        # Save to SQLite database
+        # Save to the database
         try:
-            conn = sqlite3.connect('obsidian.db')
-            cursor = conn.cursor()
-            
-            # Create table if not exists
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS access_requests (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT NOT NULL,
-                    email TEXT NOT NULL,
-                    reason TEXT,
-                    status TEXT DEFAULT 'pending',
-                    submitted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    reviewed_at TIMESTAMP
-                )
-            ''')
-            
-            # Insert request
-            cursor.execute('''
-                INSERT INTO access_requests (name, email, reason)
-                VALUES (?, ?, ?)
-            ''', (request_data.name, request_data.email, request_data.reason or ""))
-            
-            conn.commit()
-            request_id = cursor.lastrowid
-            conn.close()
-            
+            request_id = (await create_access_request(db, request_data.name, request_data.email, request_data.reason)).id
         except Exception as db_error:
+            await db.rollback()
             print(f"Database error: {db_error}")
             request_id = None
         
@@ -449,7 +762,7 @@ async def validate_admin(token: str = None):
         return {"valid": False, "message": "Validation failed"}
 
 @app.get("/api/admin/access-requests")
-async def get_access_requests(token: str = None, db: Session = Depends(get_db)):
+async def get_access_requests(token: str = None, db: AsyncSession = Depends(get_async_db)):
     """Get all access requests (admin only)"""
     try:
         # Simple token validation
@@ -468,28 +781,15 @@ async def get_access_requests(token: str = None, db: Session = Depends(get_db)):
                 "error": "Token expired"
             }
         
-        # Fetch from SQLite
-        conn = sqlite3.connect('obsidian.db')
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT id, name, email, reason, status, 
-                   submitted_at FROM access_requests 
-            ORDER BY submitted_at DESC
-        ''')
-        
-        rows = cursor.fetchall()
-        conn.close()
-        
         requests = []
-        for row in rows:
+        for request in await list_access_requests(db):
             requests.append({
-                "id": row[0],
-                "name": row[1],
-                "email": row[2],
-                "reason": row[3],
-                "status": row[4],
-                "submitted_at": row[5]
+                "id": request.id,
+                "name": request.name,
+                "email": request.email,
+                "reason": request.reason,
+                "status": request.status,
+                "submitted_at": request.submitted_at.strftime("%Y-%m-%d %H:%M:%S") if request.submitted_at else None
             })
         
         return {
@@ -506,7 +806,8 @@ async def get_access_requests(token: str = None, db: Session = Depends(get_db)):
         }
 
 @app.put("/api/admin/access-requests/{request_id}")
-async def update_access_request(request_id: int, status: str = "approved", token: str = None):
+async def update_access_request(request_id: int, status: str = "approved", token: str = None,
+                                db: AsyncSession = Depends(get_async_db)):
     """Update access request status"""
     try:
         # Simple token validation
@@ -525,25 +826,13 @@ async def update_access_request(request_id: int, status: str = "approved", token
                 "error": "Token expired"
             }
         
-        if status not in ['approved', 'rejected', 'pending']:
+        if status not in ACCESS_REQUEST_STATUSES:
             return {
                 "success": False,
                 "error": "Invalid status"
             }
         
-        # Update in SQLite
-        conn = sqlite3.connect('obsidian.db')
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            UPDATE access_requests 
-            SET status = ?, reviewed_at = datetime('now')
-            WHERE id = ?
-        ''', (status, request_id))
-        
-        conn.commit()
-        updated = cursor.rowcount > 0
-        conn.close()
+        updated = await set_access_request_status(db, request_id, status)
         
         if updated:
             return {
@@ -564,197 +853,128 @@ async def update_access_request(request_id: int, status: str = "approved", token
         }
     
 # =============== NEW ENDPOINTS FOR BUTTON CONNECTIVITY ===============
+def filter_users_conditions(criteria: FilterCriteria):
+    """WHERE clauses for the criteria, on the stored risk columns"""
+    conditions = []
+    if criteria.minRisk is not None:
+        conditions.append(UserPermissionModel.risk_score >= criteria.minRisk)
+    if criteria.maxRisk is not None:
+        conditions.append(UserPermissionModel.risk_score <= criteria.maxRisk)
+    if criteria.status:
+        conditions.append(UserPermissionModel.risk_tier == criteria.status)
+    if criteria.role:
+        conditions.append(UserPermissionModel.current_role == criteria.role)
+    return conditions
+
 @app.post("/api/users/filter", response_model=List[UserResponse])
-def filter_users(criteria: FilterCriteria, db: Session = Depends(get_db)):
-    """Filter users by criteria"""
-    query = db.query(UserPermissionModel)
-    
-    # Apply filters based on criteria
-    risk_data = calculate_risk_scores(db)
-    
-    # Get all users first
-    users = db.query(UserPermissionModel).all()
-    
-    # Filter in Python (could be optimized with SQL queries)
-    filtered_users = []
-    for user in users:
-        user_risk = risk_data.get(user.id, {"risk_score": 0, "status": "low"})
-        risk_score = user_risk.get("risk_score", 0)
-        
-        # Apply filters
-        if criteria.minRisk is not None and risk_score < criteria.minRisk:
-            continue
-        if criteria.maxRisk is not None and risk_score > criteria.maxRisk:
-            continue
-            
-        # Map risk score to status for filtering
-        if risk_score >= 80:
-            status = "critical"
-        elif risk_score >= 60:
-            status = "high"
-        elif risk_score >= 40:
-            status = "medium"
-        else:
-            status = "low"
-            
-        if criteria.status and status != criteria.status:
-            continue
-        if criteria.role and user.current_role != criteria.role:
-            continue
-            
-        # Calculate time since last update
-        if user.last_updated:
-            time_diff = datetime.utcnow() - user.last_updated
-            if time_diff.days == 0:
-                if time_diff.seconds < 3600:
-                    last_change = f"{time_diff.seconds // 60} minutes ago"
-                else:
-                    last_change = f"{time_diff.seconds // 3600} hours ago"
-            elif time_diff.days == 1:
-                last_change = "yesterday"
-            else:
-                last_change = f"{time_diff.days} days ago"
-        else:
-            last_change = "never"
-        
-        # Calculate excess permissions
-        excess_perms = 0
-        if user.accumulated_permissions:
-            role_permissions = {
-                "HR": ["view_salaries", "edit_profiles", "onboard_users"],
-                "Developer": ["access_github", "deploy_code", "read_logs"],
-                "Finance": ["process_payments", "view_tax_data", "approve_expenses"],
-                "DevOps": ["db_admin", "server_root", "manage_cloud"]
-            }
-            expected = role_permissions.get(user.current_role, [])
-            excess_perms = len([p for p in user.accumulated_permissions if p not in expected])
-        
-        filtered_users.append(UserResponse(
-            id=user.id,
-            name=user.username,
-            role=user.current_role,
-            department=user.current_role,
-            riskScore=risk_score,
-            permissions=len(user.accumulated_permissions) if user.accumulated_permissions else 0,
-            excessPermissions=excess_perms,
-            lastChange=last_change,
-            status=status
-        ))
-    
-    return filtered_users
+async def filter_users(criteria: FilterCriteria, response: Response, fields: Optional[str] = None,
+                       response_format: str = Query("rows", alias="format"),
+                       db: AsyncSession = Depends(get_async_db)):
+    """Filter users by criteria (one keyset page; the next cursor is in X-Next-Cursor)"""
+    # Stored scores only: filtering never waits for (or triggers) a model fit
+    stmt = select(UserPermissionModel).where(*filter_users_conditions(criteria))
+    users = await user_page(db, response, stmt, criteria.sortBy, criteria.sortOrder, criteria.cursor, criteria.limit)
+    rows = [user_response(user) for user in users]
+    return json_response(list_payload(rows, fields, response_format, USER_FIELDS), response)
+
+@app.post("/api/users/filter/count")
+async def count_filtered_users(criteria: FilterCriteria, db: AsyncSession = Depends(get_async_db)):
+    """Count users matching the criteria, with a breakdown by risk tier"""
+    rows = (await db.execute(
+        select(UserPermissionModel.risk_tier, func.count(UserPermissionModel.id))
+        .where(*filter_users_conditions(criteria))
+        .group_by(UserPermissionModel.risk_tier)
+    )).all()
+    # Users not scored yet have no tier and count as low
+    by_tier = {}
+    for tier, count in rows:
+        by_tier[tier or "low"] = by_tier.get(tier or "low", 0) + count
+    return {"count": sum(by_tier.values()), "by_tier": by_tier}
 
 @app.get("/api/export/users")
-def export_users_csv(db: Session = Depends(get_db)):
-    """Export users to CSV"""
-    users = db.query(UserPermissionModel).all()
-    risk_data = calculate_risk_scores(db)
-    
-    # Create CSV in memory
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    # Write header
-    writer.writerow([
-        "ID", "Username", "Role", "Risk Score", "Total Permissions", 
-        "Excess Permissions", "Status", "Last Updated"
-    ])
-    
-    # Write data
-    for user in users:
-        user_risk = risk_data.get(user.id, {"risk_score": 0, "status": "low"})
-        risk_score = user_risk.get("risk_score", 0)
-        
-        # Determine status
-        if risk_score >= 80:
-            status_val = "critical"
-        elif risk_score >= 60:
-            status_val = "high"
-        elif risk_score >= 40:
-            status_val = "medium"
-        else:
-            status_val = "low"
-        
-        # Calculate excess permissions
-        excess_perms = 0
-        if user.accumulated_permissions:
-            role_permissions = {
-                "HR": ["view_salaries", "edit_profiles", "onboard_users"],
-                "Developer": ["access_github", "deploy_code", "read_logs"],
-                "Finance": ["process_payments", "view_tax_data", "approve_expenses"],
-                "DevOps": ["db_admin", "server_root", "manage_cloud"]
-            }
-            expected = role_permissions.get(user.current_role, [])
-            excess_perms = len([p for p in user.accumulated_permissions if p not in expected])
-        
-        last_updated_str = user.last_updated.strftime("%Y-%m-%d %H:%M:%S") if user.last_updated else "N/A"
-        
-        writer.writerow([
-            user.id,
-            user.username,
-            user.current_role,
-            f"{risk_score:.1f}",
-            len(user.accumulated_permissions) if user.accumulated_permissions else 0,
-            excess_perms,
-            status_val,
-            last_updated_str
-        ])
-    
-    # Return CSV file
-    output.seek(0)
+def export_users_csv(gzip: bool = False, db: Session = Depends(get_db)):
+    """Export users to CSV, streamed as it is read (gzipped with ?gzip=true)"""
+    # Make sure the stored scores come from at least one scoring run
+    get_risk_scores(db)
+
+    stmt = select(
+        UserPermissionModel.id, UserPermissionModel.username, UserPermissionModel.current_role,
+        UserPermissionModel.risk_score, UserPermissionModel.accumulated_permissions,
+        UserPermissionModel.excess_permissions, UserPermissionModel.risk_tier, UserPermissionModel.last_updated
+    ).order_by(UserPermissionModel.id)
+
+    def rows():
+        # Write header
+        yield [
+            "ID", "Username", "Role", "Risk Score", "Total Permissions",
+            "Excess Permissions", "Status", "Last Updated"
+        ]
+        for user in stream_query(stmt):
+            risk_score = user.risk_score or 0
+            yield [
+                user.id,
+                user.username,
+                user.current_role,
+                f"{risk_score:.1f}",
+                len(user.accumulated_permissions) if user.accumulated_permissions else 0,
+                user.excess_permissions or 0,
+                user.risk_tier or risk_tier(risk_score),
+                user.last_updated.strftime("%Y-%m-%d %H:%M:%S") if user.last_updated else "N/A"
+            ]
+
+    filename = f"users_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+    return csv_response(rows(), filename, gzip)
+
+def csv_response(rows, filename, gzip=False):
+    """Stream CSV rows as a file download, optionally as a .csv.gz"""
+    if gzip:
+        filename += ".gz"
     return StreamingResponse(
-        iter([output.getvalue()]),
-        media_type="text/csv",
-        headers={"Content-Disposition": f"attachment; filename=users_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"}
+        encode_chunks(csv_chunks(rows), gzip),
+        media_type="application/gzip" if gzip else "text/csv",
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
     )
 
-@app.get("/api/anomalies/all")
-def get_all_anomalies(page: int = 1, limit: int = 50, db: Session = Depends(get_db)):
-    """Get paginated anomalies"""
-    risk_data = calculate_risk_scores(db)
-    users = db.query(UserPermissionModel).all()
-    
-    anomalies = []
-    for user in users:
-        user_risk = risk_data.get(user.id, {})
-        
-        if user_risk.get("status") == "⚠️ DANGER" or user_risk.get("risk_score", 0) >= 60:
-            reason = user_risk.get("reason", "Unknown risk factors")
-            
-            systems = {
-                "view_salaries": "HR System",
-                "db_admin": "Database",
-                "process_payments": "Finance Portal",
-                "deploy_code": "CI/CD System"
-            }
-            
-            detected_system = "Multiple Systems"
-            if user.accumulated_permissions:
-                for perm in user.accumulated_permissions:
-                    if perm in systems:
-                        detected_system = systems[perm]
-                        break
-            
-            anomalies.append({
-                "id": len(anomalies) + 1,
-                "user": user.username,
-                "description": f"High risk detected: {reason}",
-                "severity": "High" if user_risk.get("risk_score", 0) < 80 else "Critical",
-                "time": "Recent",
-                "system": detected_system
-            })
-    
-    # Simple pagination
-    start_idx = (page - 1) * limit
-    end_idx = start_idx + limit
-    paginated = anomalies[start_idx:end_idx]
+# Sort keys for anomaly pages
+ANOMALY_SORT_COLUMNS = {
+    "riskScore": AnomalyModel.risk_score,
+    "detectedAt": AnomalyModel.detected_at,
+    "name": AnomalyModel.username
+}
+
+@app.get("/api/anomalies/all", dependencies=[Depends(conditional_get)])
+async def get_all_anomalies(response: Response, cursor: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE,
+                            sortBy: str = "riskScore", sortOrder: str = "desc", flagged: bool = False,
+                            fields: Optional[str] = None, response_format: str = Query("rows", alias="format"),
+                            db: AsyncSession = Depends(get_async_db)):
+    """Get one keyset page of open anomalies (?fields= and ?format=columnar as for /api/users).
+
+    flagged=true keeps only the ones the model flags as DANGER, the set
+    /api/dashboard and the anomaly counter show.
+    """
+    if sortBy not in ANOMALY_SORT_COLUMNS:
+        raise HTTPException(status_code=400, detail=f"Unknown sort key: {sortBy}")
+    limit = max(1, min(limit or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE))
+
+    try:
+        anomalies, next_cursor = await keyset_page(
+            db, flagged_anomalies(ordered=False) if flagged else open_anomalies(), sortBy, ANOMALY_SORT_COLUMNS[sortBy], AnomalyModel.id,
+            descending=sortOrder == "desc", cursor=cursor, limit=limit
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    return {
-        "anomalies": paginated,
-        "page": page,
+    rows = [anomaly_response(anomaly) for anomaly in anomalies]
+    return json_response({
+        "anomalies": list_payload(rows, fields, response_format, ANOMALY_FIELDS),
         "limit": limit,
-        "total": len(anomalies),
-        "total_pages": (len(anomalies) + limit - 1) // limit
-    }
+        "next_cursor": next_cursor,
+        "total": await db.scalar(
+            select(func.count()).select_from(
+                (flagged_anomalies(ordered=False) if flagged else open_anomalies()).subquery()
+            )
+        )
+    }, response)
 
 @app.post("/api/system/health-check")
 def system_health_check(db: Session = Depends(get_db)):
@@ -803,65 +1023,50 @@ def system_health_check(db: Session = Depends(get_db)):
     }
 
 @app.post("/api/reports/compliance")
-def generate_compliance_report(report_type: ReportType, db: Session = Depends(get_db)):
-    """Generate compliance report"""
-    users = db.query(UserPermissionModel).all()
-    risk_data = calculate_risk_scores(db)
+def generate_compliance_report(report_type: ReportType, gzip: bool = False, db: Session = Depends(get_db)):
+    """Generate compliance report, streamed as it is read (gzipped with ?gzip=true)"""
+    risk_data = get_risk_scores(db)
     
-    # Calculate compliance metrics
-    total_users = len(users)
-    high_risk_count = sum(1 for data in risk_data.values() if data.get("risk_score", 0) >= 60)
+    # Calculate compliance metrics in SQL rather than over loaded users
+    total_users, high_risk_count = db.execute(select(
+        func.count(UserPermissionModel.id),
+        func.coalesce(func.sum(case((UserPermissionModel.risk_score >= 60, 1), else_=0)), 0)
+    )).one()
     
     if risk_data:
         compliance_score = 100 - (sum(data.get("risk_score", 0) for data in risk_data.values()) / len(risk_data))
     else:
         compliance_score = 100
     
-    # Create CSV report
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    writer.writerow(["AccessGuardian AI - Compliance Report"])
-    writer.writerow([f"Generated: {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}"])
-    writer.writerow([f"Report Type: {report_type.type.upper()}"])
-    writer.writerow([])
-    writer.writerow(["SUMMARY METRICS"])
-    writer.writerow(["Total Users", str(total_users)])
-    writer.writerow(["High Risk Users", str(high_risk_count)])
-    writer.writerow(["Compliance Score", f"{compliance_score:.1f}%"])
-    writer.writerow(["AI Model Version", "v2.1"])
-    writer.writerow([])
-    writer.writerow(["HIGH RISK USERS"])
-    writer.writerow(["Username", "Role", "Risk Score", "Excess Permissions", "AI Explanation"])
+    stmt = select(
+        UserPermissionModel.id, UserPermissionModel.username, UserPermissionModel.current_role,
+        UserPermissionModel.risk_score, UserPermissionModel.excess_permissions
+    ).where(UserPermissionModel.risk_score >= 60).order_by(UserPermissionModel.id)
     
-    for user in users:
-        user_risk = risk_data.get(user.id, {})
-        if user_risk.get("risk_score", 0) >= 60:
-            excess_perms = 0
-            if user.accumulated_permissions:
-                role_permissions = {
-                    "HR": ["view_salaries", "edit_profiles", "onboard_users"],
-                    "Developer": ["access_github", "deploy_code", "read_logs"],
-                    "Finance": ["process_payments", "view_tax_data", "approve_expenses"],
-                    "DevOps": ["db_admin", "server_root", "manage_cloud"]
-                }
-                expected = role_permissions.get(user.current_role, [])
-                excess_perms = len([p for p in user.accumulated_permissions if p not in expected])
-            
-            writer.writerow([
+    def rows():
+        yield ["AccessGuardian AI - Compliance Report"]
+        yield [f"Generated: {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}"]
+        yield [f"Report Type: {report_type.type.upper()}"]
+        yield []
+        yield ["SUMMARY METRICS"]
+        yield ["Total Users", str(total_users)]
+        yield ["High Risk Users", str(high_risk_count)]
+        yield ["Compliance Score", f"{compliance_score:.1f}%"]
+        yield ["AI Model Version", "v2.1"]
+        yield []
+        yield ["HIGH RISK USERS"]
+        yield ["Username", "Role", "Risk Score", "Excess Permissions", "AI Explanation"]
+        
+        for user in stream_query(stmt):
+            yield [
                 user.username,
                 user.current_role,
-                f"{user_risk.get('risk_score', 0):.1f}",
-                str(excess_perms),
-                user_risk.get("reason", "No explanation available")
-            ])
+                f"{user.risk_score:.1f}",
+                str(user.excess_permissions or 0),
+                risk_data.get(user.id, {}).get("reason", "No explanation available")
+            ]
     
-    output.seek(0)
-    return StreamingResponse(
-        iter([output.getvalue()]),
-        media_type="text/csv",
-        headers={"Content-Disposition": f"attachment; filename=compliance_report_{datetime.now().strftime('%Y%m%d')}.csv"}
-    )
+    return csv_response(rows(), f"compliance_report_{datetime.now().strftime('%Y%m%d')}.csv", gzip)
 
 @app.post("/api/simulate/role-change")
 def simulate_role_change(db: Session = Depends(get_db)):
@@ -872,21 +1077,15 @@ def simulate_role_change(db: Session = Depends(get_db)):
         return {"message": "No users available for simulation"}
     
     user = random.choice(users)
-    
-    ROLES = {
-        "HR": ["view_salaries", "edit_profiles", "onboard_users"],
-        "Developer": ["access_github", "deploy_code", "read_logs"],
-        "Finance": ["process_payments", "view_tax_data", "approve_expenses"],
-        "DevOps": ["db_admin", "server_root", "manage_cloud"]
-    }
+    catalog = get_role_catalog()
     
     # Choose a new role (different from current)
-    available_roles = [r for r in ROLES.keys() if r != user.current_role]
+    available_roles = [r for r in catalog.names() if r != user.current_role]
     if not available_roles:
-        available_roles = list(ROLES.keys())
+        available_roles = catalog.names()
     
     new_role = random.choice(available_roles)
-    new_permissions = ROLES[new_role]
+    new_permissions = catalog.permissions(new_role)
     
     # THE CREEP: Add new permissions without removing old ones
     existing_perms = user.accumulated_permissions or []
@@ -895,11 +1094,12 @@ def simulate_role_change(db: Session = Depends(get_db)):
     # Update user
     old_role = user.current_role
     user.current_role = new_role
-    user.accumulated_permissions = updated_perms
+    set_user_permissions(db, user, updated_perms, source="simulate-role-change")
+    bump_data_version(db)
     db.commit()
     
-    # Recalculate risk
-    calculate_risk_scores(db, update_db=True)
+    # Rescore just this user
+    risk = score_user(db, user)
     
     return {
         "message": f"Simulated role change for {user.username}",
@@ -909,8 +1109,9 @@ def simulate_role_change(db: Session = Depends(get_db)):
             "to_role": new_role,
             "permissions_added": len(new_permissions),
             "total_permissions_now": len(updated_perms),
-            "excess_permissions": len(updated_perms) - len(ROLES.get(new_role, [])),
-            "risk_increase": "Calculating..."
+            "excess_permissions": catalog.excess_count(user),
+            "risk_increase": "Calculating...",
+            "new_risk_score": risk["risk_score"]
         },
         "demonstrates": "Privilege Creep: User kept old permissions while gaining new ones"
     }
@@ -921,16 +1122,18 @@ def calculate_risks_now(db: Session = Depends(get_db)):
     """Force risk calculation and return results"""
     risk_data = calculate_risk_scores(db, update_db=True)
     
-    # Count anomalies
-    anomalies = []
-    for user_id, data in risk_data.items():
-        if data.get("status") == "⚠️ DANGER":
-            user = db.query(UserPermissionModel).filter(UserPermissionModel.id == user_id).first()
-            anomalies.append({
-                "user": user.username,
-                "risk_score": data.get("risk_score"),
-                "reason": data.get("reason")
-            })
+    # The write-back has just synced the anomalies table
+    flagged = db.execute(flagged_anomalies()).scalars().all()
+    anomalies = [
+        {
+            "id": anomaly.id,
+            "user": anomaly.username,
+            "risk_score": anomaly.risk_score,
+            "reason": risk_data.get(anomaly.user_id, {}).get("reason"),
+            "detected_at": anomaly.detected_at.isoformat()
+        }
+        for anomaly in flagged
+    ]
     
     return {
         "message": f"Calculated risks for {len(risk_data)} users",
@@ -948,24 +1151,11 @@ def force_anomalies_demo(db: Session = Depends(get_db)):
     # Create realistic anomalies based on permission patterns
     anomalies = []
     
+    # Excess permissions per user, against the role catalog
+    excess_counts = get_role_catalog().excess_counts(users)
+    
     # Map users to anomalies
-    for user in users:
-        # Calculate permission count
-        perm_count = len(user.accumulated_permissions) if user.accumulated_permissions else 0
-        
-        # Define expected permissions per role
-        role_permissions = {
-            "HR": ["view_salaries", "edit_profiles", "onboard_users"],
-            "Developer": ["access_github", "deploy_code", "read_logs"],
-            "Finance": ["process_payments", "view_tax_data", "approve_expenses"],
-            "DevOps": ["db_admin", "server_root", "manage_cloud"]
-        }
-        
-        expected_perms = role_permissions.get(user.current_role, [])
-        excess_perms = 0
-        if user.accumulated_permissions:
-            excess_perms = len([p for p in user.accumulated_permissions if p not in expected_perms])
-        
+    for user, excess_perms in zip(users, excess_counts):
         # Create anomalies for users with excess permissions
         if excess_perms >= 2:  # At least 2 excess permissions
             severity = "Critical" if excess_perms >= 4 else "High" if excess_perms >= 3 else "Medium"
@@ -1000,79 +1190,15 @@ def force_anomalies_demo(db: Session = Depends(get_db)):
         "anomalies": anomalies,
         "users_analyzed": len(users)
     }
-# =============== HELPER FUNCTIONS ===============
-def calculate_risk_scores(db: Session, update_db=False):
-    """Calculate risk scores using Isolation Forest"""
-    users = db.query(UserPermissionModel).all()
-    
-    if not users:
-        return {}
-    
-    # Get all unique permissions
-    all_permissions = set()
-    for user in users:
-        if user.accumulated_permissions:
-            all_permissions.update(user.accumulated_permissions)
-    
-    if not all_permissions:
-        return {user.id: {"risk_score": 0, "status": "✅ SAFE", "reason": "No permissions"} 
-                for user in users}
-    
-    # Create DataFrame for AI model
-    data = []
-    for user in users:
-        row = {"user_id": user.id}
-        for perm in all_permissions:
-            row[perm] = 1 if user.accumulated_permissions and perm in user.accumulated_permissions else 0
-        data.append(row)
-    
-    try:
-        df = pd.DataFrame(data)
-        
-        # Run Isolation Forest model
-        features = df.drop('user_id', axis=1)
-        model = IsolationForest(contamination=0.1, random_state=42)
-        model.fit(features)
-        
-        # Calculate risk scores (0-100)
-        raw_scores = model.decision_function(features)
-        risk_scores = [round((0.5 - s) * 100, 1) for s in raw_scores]
-        
-        # Get reasons (columns with 1 where average is low)
-        result = {}
-        for idx, user in enumerate(users):
-            risk_score = max(0, min(100, risk_scores[idx]))  # Clamp to 0-100
-            
-            # Find suspicious permissions
-            reasons = []
-            if user.accumulated_permissions:
-                for perm in user.accumulated_permissions:
-                    perm_avg = features[perm].mean()
-                    if perm_avg < 0.3:  # Rare permission
-                        reasons.append(perm)
-            
-            status = "⚠️ DANGER" if risk_score > 65 else "✅ SAFE"
-            
-            result[user.id] = {
-                "risk_score": risk_score,
-                "status": status,
-                "reason": ", ".join(reasons) if reasons else "Normal Usage"
-            }
-            
-            # Update database if requested
-            if update_db:
-                user.risk_score = risk_score
-                db.commit()
-        
-        return result
-        
-    except Exception as e:
-        print(f"AI calculation error: {e}")
-        # Return default scores if AI fails
-        return {user.id: {"risk_score": 0, "status": "✅ SAFE", "reason": "AI Error"} 
-                for user in users}
-
+REMEDIATION_ACTIONS = {"remove_all", "review"}
 
+def remediated_permissions(current, data: BulkRemediation):
+    """Permissions left after a remediation action (None for an unknown action)"""
+    if data.action == "remove_all":
+        return []
+    if data.action == "review":
+        return [p for p in current or [] if p not in (data.permissions or [])]
+    return None
 
 # Add this endpoint to handle the frontend buttons
 @app.post("/api/remediate-bulk")
@@ -1083,15 +1209,15 @@ def handle_bulk_remediation(data: BulkRemediation, db: Session = Depends(get_db)
         raise HTTPException(status_code=404, detail="User not found")
 
     # Perform the cleanup logic
-    if data.action == "remove_all":
-        user.accumulated_permissions = [] 
-    elif data.action == "review":
-        user.accumulated_permissions = [p for p in user.accumulated_permissions if p not in data.permissions]
+    remaining = remediated_permissions(user.accumulated_permissions, data)
+    if remaining is not None:
+        set_user_permissions(db, user, remaining, source="remediate-bulk")
 
+    bump_data_version(db)
     db.commit()
     
-    # CRITICAL: Recalculate and return the exact structure the UI needs
-    risk_data = calculate_risk_scores(db, update_db=True)
+    # CRITICAL: Rescore the user and return the exact structure the UI needs
+    risk = score_user(db, user)
     
     # This return object MUST match the 'result' your frontend uses in 'onSubmit(result)'
     # After your db.commit() and risk calculation
@@ -1099,5 +1225,57 @@ def handle_bulk_remediation(data: BulkRemediation, db: Session = Depends(get_db)
         "status": "success",
         "message": "Privilege creep remediated successfully",
         "user": user.username,
-        "new_risk_score": user.risk_score
-    }
\ No newline at end of file
+        "new_risk_score": risk["risk_score"]
+    }
+
+class BatchRemediation(BaseModel):
+    items: List[BulkRemediation]
+
+@app.post("/api/remediate-bulk/batch")
+def handle_batch_remediation(data: BatchRemediation, db: Session = Depends(get_db)):
+    """Remediate many users in one transaction and rescore them together.
+
+    Items for the same user are applied in order. Unknown users and actions
+    are reported per item without failing the rest.
+    """
+    usernames = {item.username for item in data.items}
+    users = {
+        user.username: user
+        for user in db.query(UserPermissionModel).filter(UserPermissionModel.username.in_(usernames))
+    }
+
+    pending = {}
+    results = []
+    for item in data.items:
+        user = users.get(item.username)
+        if not user:
+            results.append({"user": item.username, "status": "error", "error": "User not found"})
+            continue
+        if item.action not in REMEDIATION_ACTIONS:
+            results.append({"user": item.username, "status": "error", "error": f"Unknown action: {item.action}"})
+            continue
+        pending[user.username] = remediated_permissions(pending.get(user.username, user.accumulated_permissions), item)
+        results.append({"user": user.username, "status": "success"})
+
+    risk = {}
+    if pending:
+        remediated = [users[name] for name in pending]
+        set_users_permissions(db, [(users[name], perms) for name, perms in pending.items()], source="remediate-bulk")
+        bump_data_version(db)
+        db.commit()
+
+        # One scoring pass for everyone touched, against the current model
+        risk = score_users(db, remediated)
+
+    for result in results:
+        if result["status"] == "success":
+            result["new_risk_score"] = risk[users[result["user"]].id]["risk_score"]
+
+    failed = sum(1 for result in results if result["status"] == "error")
+    return {
+        "status": "success" if not failed else "partial",
+        "message": f"Remediated {len(pending)} users",
+        "remediated": len(pending),
+        "failed": failed,
+        "results": results
+    }
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, JSON, DateTime
+from sqlalchemy import Column, Integer, String, JSON, DateTime, ForeignKey, Index
 from sqlalchemy.ext.declarative import declarative_base
 import datetime
 
@@ -17,4 +17,128 @@ class UserPermissionModel(Base):
     # Risk score calculated by the AI Engine [cite: 84, 87]
     risk_score = Column(Integer, default=0) 
     
-    last_updated = Column(DateTime, default=datetime.datetime.utcnow)
\ No newline at end of file
+    last_updated = Column(DateTime, default=datetime.datetime.utcnow)
+
+    # Stored alongside the score by every scoring run so the user list can be
+    # filtered and sorted in SQL without touching the model
+    risk_tier = Column(String, default="low")
+    excess_permissions = Column(Integer, default=0)
+    # When the stored score last changed (full runs leave unchanged rows alone)
+    last_scored_at = Column(DateTime)
+
+    __table_args__ = (
+        Index("ix_user_permissions_risk_score", "risk_score"),
+        Index("ix_user_permissions_tier_score", "risk_tier", "risk_score"),
+        Index("ix_user_permissions_role_score", "current_role", "risk_score"),
+        Index("ix_user_permissions_last_updated", "last_updated"),
+        # Ids of deleted users are never handed out again (the permission
+        # events log refers to users by id)
+        {"sqlite_autoincrement": True},
+    )
+
+class DataVersion(Base):
+    __tablename__ = "data_version"
+
+    # Single row (id=1) holding a counter that every permission write bumps,
+    # so cached risk scores know when they are stale
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, default=0, nullable=False)
+
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+    # Bumped by every scoring write-back, which changes stored scores and
+    # anomalies without a permission write. Together with version this
+    # keys the ETags of the read endpoints.
+    scores_version = Column(Integer, default=0)
+    scored_at = Column(DateTime)
+
+
+class PermissionModel(Base):
+    __tablename__ = "permissions"
+
+    # Catalog of permission names, interned to integer ids
+    id = Column(Integer, primary_key=True)
+    name = Column(String, unique=True, index=True, nullable=False)
+
+class UserPermissionGrant(Base):
+    __tablename__ = "user_permission_grants"
+
+    # One row per (user, permission) held. The JSON list on user_permissions
+    # is kept in sync with this table for the existing API responses.
+    user_id = Column(Integer, ForeignKey("user_permissions.id", ondelete="CASCADE"), primary_key=True)
+    permission_id = Column(Integer, ForeignKey("permissions.id"), primary_key=True)
+
+    granted_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+    __table_args__ = (
+        # The primary key covers lookups by user; this one covers "who holds X"
+        Index("ix_user_permission_grants_permission_user", "permission_id", "user_id"),
+    )
+
+class PermissionEventModel(Base):
+    __tablename__ = "permission_events"
+
+    # Append-only log of every grant and revoke, in commit order. No foreign
+    # key on the user so the history outlives them.
+    seq = Column(Integer, primary_key=True)
+    user_id = Column(Integer, nullable=False)
+    username = Column(String, nullable=False)
+
+    action = Column(String, nullable=False)  # "grant" or "revoke"
+    permission = Column(String, nullable=False)
+    role = Column(String)  # the user's role after the change
+    source = Column(String)  # the endpoint that made it
+
+    created_at = Column(DateTime, default=datetime.datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        Index("ix_permission_events_user_seq", "user_id", "seq"),
+        Index("ix_permission_events_created_at", "created_at"),
+        # Sequence numbers are never reused, so "since N" stays meaningful
+        {"sqlite_autoincrement": True},
+    )
+
+class AnomalyModel(Base):
+    __tablename__ = "anomalies"
+
+    # One row per detection: it stays open (resolved_at NULL) and keeps its id
+    # while the user remains above the anomaly threshold, and is resolved
+    # once they drop below it. A later relapse opens a new row.
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("user_permissions.id", ondelete="CASCADE"), nullable=False)
+    username = Column(String, nullable=False)
+
+    description = Column(String)
+    severity = Column(String)
+    system = Column(String)
+    risk_score = Column(Integer)
+
+    detected_at = Column(DateTime, default=datetime.datetime.utcnow, nullable=False)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow)
+    resolved_at = Column(DateTime)
+
+    __table_args__ = (
+        Index("ix_anomalies_user_resolved", "user_id", "resolved_at"),
+        Index("ix_anomalies_resolved_score", "resolved_at", "risk_score"),
+        Index("ix_anomalies_severity", "severity"),
+        Index("ix_anomalies_detected_at", "detected_at"),
+    )
+
+class AccessRequestModel(Base):
+    __tablename__ = "access_requests"
+
+    # Requests for dashboard access, reviewed by an admin
+    id = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False)
+    email = Column(String, nullable=False)
+    reason = Column(String)
+    status = Column(String, default="pending")
+
+    submitted_at = Column(DateTime, default=datetime.datetime.utcnow)
+    reviewed_at = Column(DateTime)
+
+    __table_args__ = (
+        Index("ix_access_requests_submitted_at", "submitted_at"),
+        # Same AUTOINCREMENT ids as the table the raw sqlite3 code used to create
+        {"sqlite_autoincrement": True},
+    )
@@ -0,0 +1,96 @@
+from sqlalchemy import DateTime, and_, or_
+import base64
+import datetime
+import json
+
+# Page size used when the client does not ask for one, and the most it may ask for
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+# =============== CURSORS ===============
+def encode_cursor(state: dict):
+    """Pack keyset state into an opaque URL-safe token"""
+    raw = json.dumps(state, separators=(",", ":"), default=str).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: str):
+    """Unpack a token made by encode_cursor (ValueError if it is not one)"""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        state = json.loads(raw)
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(state, dict):
+        raise ValueError("Invalid cursor")
+    return state
+
+
+# =============== KEYSET PAGES ===============
+async def keyset_page(db, stmt, sort_name, sort_column, id_column, descending=False, cursor=None,
+                      limit=DEFAULT_PAGE_SIZE):
+    """Fetch one page of stmt's entities ordered by (sort_column, id_column) after the cursor.
+
+    Only limit + 1 rows are read (the extra one tells whether another page
+    follows). The cursor carries the sort it was made for, so it cannot be
+    replayed against a different ordering. Returns (rows, next_cursor).
+    """
+    limit = max(1, min(limit or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE))
+    stmt = keyset_select(stmt, sort_name, sort_column, id_column, descending, cursor, limit)
+    rows = (await db.execute(stmt)).scalars().all()
+    return next_page(rows, limit, sort_name, sort_column, id_column, descending)
+
+
+def keyset_select(stmt, sort_name, sort_column, id_column, descending, cursor, limit):
+    """Order a select by the keyset and bound it to limit + 1 rows after the cursor"""
+    direction = "desc" if descending else "asc"
+
+    if cursor:
+        state = decode_cursor(cursor)
+        if state.get("sort") != sort_name or state.get("dir") != direction or "id" not in state:
+            raise ValueError("Cursor does not match the requested sort")
+        last_value = state.get("value")
+        if last_value is not None and isinstance(sort_column.type, DateTime):
+            last_value = datetime.datetime.fromisoformat(last_value)
+
+        stmt = stmt.where(_after(sort_column, id_column, descending, last_value, state["id"]))
+
+    if descending:
+        stmt = stmt.order_by(sort_column.desc(), id_column.desc())
+    else:
+        stmt = stmt.order_by(sort_column, id_column)
+    return stmt.limit(limit + 1)
+
+
+def _after(sort_column, id_column, descending, last_value, last_id):
+    """Condition for the rows after (last_value, last_id) in keyset order.
+
+    Comparisons with NULL are never true, so nullable sort columns get
+    explicit IS NULL branches that follow SQLite's ordering: NULLs come
+    first ascending and last descending.
+    """
+    nullable = getattr(sort_column.expression, "nullable", True)
+    if descending:
+        if last_value is None:
+            return and_(sort_column.is_(None), id_column < last_id)
+        after = or_(sort_column < last_value, and_(sort_column == last_value, id_column < last_id))
+        return or_(after, sort_column.is_(None)) if nullable else after
+
+    if last_value is None:
+        return or_(sort_column.is_not(None), and_(sort_column.is_(None), id_column > last_id))
+    return or_(sort_column > last_value, and_(sort_column == last_value, id_column > last_id))
+
+
+def next_page(rows, limit, sort_name, sort_column, id_column, descending):
+    """Drop the look-ahead row and build the cursor for the page after it"""
+    if len(rows) <= limit:
+        return list(rows), None
+    rows = list(rows[:limit])
+    last = rows[-1]
+    return rows, encode_cursor({
+        "sort": sort_name,
+        "dir": "desc" if descending else "asc",
+        "value": getattr(last, sort_column.key),
+        "id": getattr(last, id_column.key)
+    })
@@ -0,0 +1,184 @@
+from sqlalchemy import and_, insert, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from backend.models import UserPermissionModel, PermissionModel, UserPermissionGrant, PermissionEventModel
+import datetime
+
+
+# =============== PERMISSION CATALOG ===============
+def get_permission_ids(db: Session, names, create=True):
+    """Map permission names to catalog ids, adding unknown names when create=True"""
+    names = set(names)
+    if not names:
+        return {}
+
+    rows = db.query(PermissionModel.name, PermissionModel.id).filter(PermissionModel.name.in_(names)).all()
+    ids = dict(rows)
+
+    missing = names - ids.keys()
+    if missing and create:
+        db.execute(insert(PermissionModel), [{"name": name} for name in sorted(missing)])
+        rows = db.query(PermissionModel.name, PermissionModel.id).filter(PermissionModel.name.in_(missing)).all()
+        ids.update(rows)
+    return ids
+
+
+# =============== GRANTS ===============
+def set_user_permissions(db: Session, user: UserPermissionModel, permissions, source=None):
+    """Replace a user's permissions, touching only the grants that changed.
+
+    Keeps the JSON list on the user and the grants table in step, and appends
+    one permission event per grant or revoke (tagged with source). Does not
+    commit. Returns the (added, removed) permission name sets.
+    """
+    return set_users_permissions(db, [(user, permissions)], source)[0]
+
+
+def set_users_permissions(db: Session, changes, source=None):
+    """set_user_permissions for many (user, permissions) pairs with one round of statements.
+
+    Does not commit. Returns an (added, removed) pair per change, in order.
+    """
+    diffs = []
+    for user, permissions in changes:
+        new = set(permissions)
+        old = set(user.accumulated_permissions or [])
+        user.accumulated_permissions = sorted(new)
+        diffs.append((new - old, old - new))
+
+    # New users need their id before grants can point at them
+    if any(user.id is None for user, _ in changes):
+        db.flush()
+
+    ids = get_permission_ids(db, {name for added, removed in diffs for name in added | removed})
+    grants = [
+        {"user_id": user.id, "permission_id": ids[name]}
+        for (user, _), (added, _) in zip(changes, diffs)
+        for name in sorted(added)
+    ]
+    if grants:
+        db.execute(insert(UserPermissionGrant), grants)
+    for (user, _), (_, removed) in zip(changes, diffs):
+        if removed:
+            db.query(UserPermissionGrant).filter(
+                UserPermissionGrant.user_id == user.id,
+                UserPermissionGrant.permission_id.in_([ids[name] for name in removed])
+            ).delete(synchronize_session=False)
+
+    events = [
+        event
+        for (user, _), (added, removed) in zip(changes, diffs)
+        for event in permission_event_rows(user, added, removed, source)
+    ]
+    if events:
+        db.execute(insert(PermissionEventModel), events)
+    return diffs
+
+
+def rebuild_permission_grants(db: Session):
+    """Rebuild the catalog and grants from every user's JSON list (commits)"""
+    users = db.query(UserPermissionModel.id, UserPermissionModel.accumulated_permissions).all()
+    ids = get_permission_ids(db, {perm for _, perms in users for perm in (perms or [])})
+
+    db.query(UserPermissionGrant).delete(synchronize_session=False)
+    grants = [
+        {"user_id": user_id, "permission_id": ids[perm]}
+        for user_id, perms in users
+        for perm in set(perms or [])
+    ]
+    if grants:
+        db.execute(insert(UserPermissionGrant), grants)
+    db.commit()
+    return len(grants)
+
+
+def migrate_permission_grants(db: Session):
+    """One-time migration: fill the grants table from the JSON column if it is empty"""
+    if db.query(UserPermissionGrant).first() is not None:
+        return 0
+    if db.query(UserPermissionModel.id).filter(UserPermissionModel.accumulated_permissions.isnot(None)).first() is None:
+        return 0
+    return rebuild_permission_grants(db)
+
+
+# =============== EVENT LOG ===============
+def permission_event_rows(user: UserPermissionModel, added, removed, source=None):
+    """Event rows for one user's change, revokes first"""
+    now = datetime.datetime.utcnow()
+    return [
+        {"user_id": user.id, "username": user.username, "action": action, "permission": name,
+         "role": user.current_role, "source": source, "created_at": now}
+        for action, names in (("revoke", removed), ("grant", added))
+        for name in sorted(names)
+    ]
+
+
+def _user_events(user: UserPermissionModel):
+    """Condition for a user's own events.
+
+    The username is matched as well as the id: databases created before
+    user ids were made AUTOINCREMENT hand a deleted user's id to the next
+    user, and its events must not be read as theirs.
+    """
+    return and_(PermissionEventModel.user_id == user.id, PermissionEventModel.username == user.username)
+
+
+async def permission_events_since(db: AsyncSession, since=0, limit=500, user: UserPermissionModel = None):
+    """Events with a sequence number above since, oldest first (only the user's when given)"""
+    stmt = select(PermissionEventModel).where(PermissionEventModel.seq > since)
+    if user is not None:
+        stmt = stmt.where(_user_events(user))
+    result = await db.execute(stmt.order_by(PermissionEventModel.seq).limit(limit))
+    return result.scalars().all()
+
+
+async def latest_event_seq(db: AsyncSession):
+    """Sequence number of the newest event (0 when the log is empty)"""
+    return (await db.execute(select(func.max(PermissionEventModel.seq)))).scalar() or 0
+
+
+async def permissions_at(db: AsyncSession, user: UserPermissionModel, at=None, seq=None):
+    """A user's permissions as they were at a time, or right after an event.
+
+    Starts from the current permissions and undoes the user's later events,
+    newest first, so users granted before the log existed reconstruct too.
+    """
+    stmt = select(PermissionEventModel.action, PermissionEventModel.permission).where(_user_events(user))
+    if seq is not None:
+        stmt = stmt.where(PermissionEventModel.seq > seq)
+    if at is not None:
+        stmt = stmt.where(PermissionEventModel.created_at > at)
+    later = (await db.execute(stmt.order_by(PermissionEventModel.seq.desc()))).all()
+
+    permissions = set(user.accumulated_permissions or [])
+    for action, permission in later:
+        if action == "grant":
+            permissions.discard(permission)
+        else:
+            permissions.add(permission)
+    return sorted(permissions)
+
+
+# =============== LOOKUPS ===============
+# Read-only lookups for the API, run on the async session
+async def users_with_permission(db: AsyncSession, permission: str):
+    """Users holding a permission, straight from the grants index"""
+    result = await db.execute(
+        select(UserPermissionModel)
+        .join(UserPermissionGrant, UserPermissionGrant.user_id == UserPermissionModel.id)
+        .join(PermissionModel, PermissionModel.id == UserPermissionGrant.permission_id)
+        .where(PermissionModel.name == permission)
+        .order_by(UserPermissionModel.username)
+    )
+    return result.scalars().all()
+
+
+async def permission_holder_counts(db: AsyncSession):
+    """Number of users holding each catalog permission, aggregated in SQL"""
+    result = await db.execute(
+        select(PermissionModel.name, func.count(UserPermissionGrant.user_id))
+        .outerjoin(UserPermissionGrant, UserPermissionGrant.permission_id == PermissionModel.id)
+        .group_by(PermissionModel.id)
+        .order_by(PermissionModel.name)
+    )
+    return result.all()
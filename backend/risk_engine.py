@@ -0,0 +1,791 @@
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+from backend.database import SessionLocal, engine, get_data_version, bump_scores_version
+from backend.models import UserPermissionModel
+from backend.role_catalog import get_role_catalog
+from backend.anomaly_store import sync_anomalies, sync_user_anomalies
+from backend.event_broker import event_broker, EVENT_MAX_USER_DELTAS
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import hashlib
+import joblib
+import multiprocessing
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.ensemble import IsolationForest
+import datetime
+import os
+import tempfile
+import threading
+import time
+
+# Permissions held by fewer than this share of users are reported as reasons
+RARE_PERMISSION_THRESHOLD = 0.3
+
+# Share of users the model treats as anomalous
+RISK_CONTAMINATION = 0.1
+
+# Single-user writes are scored against the current model; the whole
+# population is refitted once this many writes have piled up since the fit
+RISK_REFIT_EVERY = int(os.getenv("RISK_REFIT_EVERY", "50"))
+
+# Background refits wait for this many quiet seconds so a burst of writes
+# becomes one refit, and run at least this often to fold in incremental scores
+RISK_COALESCE_SECONDS = float(os.getenv("RISK_COALESCE_SECONDS", "1.0"))
+RISK_REFRESH_INTERVAL = float(os.getenv("RISK_REFRESH_INTERVAL", "300"))
+
+# "inline" fits in the calling thread; "process" ships the permission matrix to
+# a worker process so a large fit never holds the API process's GIL
+RISK_EXECUTION_MODE = os.getenv("RISK_EXECUTION_MODE", "inline")
+RISK_POOL_WORKERS = int(os.getenv("RISK_POOL_WORKERS", "1"))
+# Parallelism inside the forest itself (passed to IsolationForest n_jobs)
+RISK_N_JOBS = int(os.getenv("RISK_N_JOBS", "1"))
+
+# "role" fits a separate model per current_role so users are compared with
+# their own role's baseline; roles with fewer users than the minimum are
+# scored by the global model instead. Empty means one global model.
+RISK_PARTITION_BY = os.getenv("RISK_PARTITION_BY", "")
+RISK_MIN_PARTITION_SIZE = int(os.getenv("RISK_MIN_PARTITION_SIZE", "50"))
+
+# Scores above this are flagged "⚠️ DANGER" by the model
+RISK_DANGER_THRESHOLD = 65
+
+# Dashboard tiers by lowest risk score, highest first
+RISK_TIERS = [(80, "critical"), (60, "high"), (40, "medium"), (0, "low")]
+
+# =============== RISK CACHE ===============
+# Process-wide cache of the last scoring run. The snapshot (score table) is
+# keyed by the data version it reflects; the model remembers the data version
+# it was trained on. Both are replaced as whole objects, so a reader that
+# grabbed one never sees it change underneath it.
+_RISK_CACHE = {"snapshot": None, "model": None, "partitions": {}}
+
+# Guards snapshot swaps and incremental patches (held only briefly)
+_RISK_CACHE_LOCK = threading.RLock()
+
+# Serializes full refits so concurrent callers share one fit
+_REFIT_LOCK = threading.RLock()
+
+
+def get_risk_snapshot(db: Session):
+    """Get the current score table, refitting only when there is none to serve.
+
+    While the background service is running, a table from an older data
+    version is still served (and a refresh is requested) rather than making
+    the caller wait for a refit.
+    """
+    version = get_data_version(db)
+    snapshot = _RISK_CACHE["snapshot"]
+    if snapshot is not None and snapshot["version"] == version:
+        return snapshot
+
+    if snapshot is not None and risk_service.running:
+        risk_service.request_refresh()
+        return snapshot
+
+    with _REFIT_LOCK:
+        # Another request may have refitted while we waited for the lock
+        snapshot = _RISK_CACHE["snapshot"]
+        if snapshot is not None and snapshot["version"] == version:
+            return snapshot
+        return _calculate_snapshot(db, update_db=True)
+
+
+def get_risk_scores(db: Session):
+    """Get risk scores per user id (see get_risk_snapshot)"""
+    return get_risk_snapshot(db)["scores"]
+
+
+def get_permission_prevalence(db: Session):
+    """Get the permission prevalence table behind the current risk scores"""
+    return get_risk_snapshot(db)["prevalence"]
+
+
+def risk_snapshot_age():
+    """Seconds since the served score table was computed (None before the first run)"""
+    snapshot = _RISK_CACHE["snapshot"]
+    if snapshot is None:
+        return None
+    return time.time() - snapshot["computed_at"]
+
+
+def _make_snapshot(version, scores, prevalence):
+    return {
+        "version": version,
+        "scores": scores,
+        "prevalence": prevalence,
+        "common_permissions": {row["permission"] for row in prevalence if not row["rare"]},
+        "computed_at": time.time()
+    }
+
+
+def _swap_snapshot(snapshot):
+    with _RISK_CACHE_LOCK:
+        current = _RISK_CACHE["snapshot"]
+        # Never replace a table that incremental scoring already moved past
+        if current is not None and current["version"] is not None \
+                and current["version"] > snapshot["version"]:
+            risk_service.request_refresh()
+            return
+        _RISK_CACHE["snapshot"] = snapshot
+
+
+# =============== MODEL ARTIFACT ===============
+# The fitted model is saved next to the SQLite file so new workers can load it
+# at startup instead of fitting from scratch
+RISK_MODEL_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(engine.url.database or "obsidian.db")),
+    "risk_model.joblib"
+)
+
+
+def save_risk_model():
+    """Write the fitted model(s) (atomically, so readers never see half a file)"""
+    model_state = _RISK_CACHE["model"]
+    # Every worker refits and saves on its own, so each writes its own temp file
+    fd, tmp_path = tempfile.mkstemp(
+        prefix=os.path.basename(RISK_MODEL_PATH) + ".", suffix=".tmp", dir=os.path.dirname(RISK_MODEL_PATH)
+    )
+    os.close(fd)
+    try:
+        joblib.dump({
+            "model": model_state["model"],
+            "columns": model_state["columns"],
+            "version": model_state["version"],
+            "fingerprint": model_state["fingerprint"],
+            "partitions": _RISK_CACHE["partitions"]
+        }, tmp_path)
+        os.replace(tmp_path, RISK_MODEL_PATH)
+    except Exception as e:
+        print(f"Could not save risk model: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def load_risk_model():
+    """Warm the model cache from the saved artifact, if there is one"""
+    if not os.path.exists(RISK_MODEL_PATH):
+        return False
+
+    try:
+        artifact = joblib.load(RISK_MODEL_PATH)
+    except Exception as e:
+        print(f"Could not load risk model: {e}")
+        return False
+
+    # Artifacts without a fingerprint predate it and are never reused
+    _set_model(artifact["model"], artifact["columns"], artifact["version"], artifact.get("fingerprint"))
+    _RISK_CACHE["partitions"] = artifact.get("partitions", {})
+    return True
+
+
+def _set_model(model, columns, version, fingerprint):
+    _RISK_CACHE["model"] = {
+        "model": model,
+        "columns": columns,
+        "column_index": {name: idx for idx, name in enumerate(columns)},
+        "version": version,
+        "fingerprint": fingerprint
+    }
+
+
+def _fit_or_reuse_model(matrix, version):
+    """Score the matrix, fitting a new model unless one for this exact data exists"""
+    # A model is reused only if it was trained on the same rows: a reset or
+    # restored database can be back at an old version with different data
+    current = _RISK_CACHE["model"]
+    fingerprint = matrix.fingerprint()
+    reuse = None
+    if current is not None and current["version"] == version and current["fingerprint"] == fingerprint:
+        reuse = current["model"]
+
+    # Only the distinct rows are scored; the full matrix is shipped only when
+    # a fit needs it
+    model, raw_scores = run_risk_job(
+        fit_and_score,
+        matrix.matrix if reuse is None else None,
+        matrix.unique_matrix,
+        matrix.counts,
+        reuse,
+        RISK_N_JOBS
+    )
+
+    if reuse is None:
+        _set_model(model, matrix.columns, version, fingerprint)
+    return raw_scores
+
+
+# =============== EXECUTION ===============
+def fit_and_score(matrix, unique_matrix, counts, model=None, n_jobs=1):
+    """Fit (unless a model is given) and score the distinct permission rows.
+
+    Module-level and free of shared state so it can run in a worker process.
+    """
+    if model is not None:
+        return model, model.decision_function(unique_matrix)
+
+    # Fit on every user so the forest's subsamples keep the real multiplicity
+    # of each row. contamination="auto" skips sklearn's internal pass that
+    # scores every row to place the threshold; it is placed here from the
+    # distinct rows weighted by their counts instead, which is identical.
+    model = IsolationForest(contamination="auto", random_state=42, n_jobs=n_jobs)
+    model.fit(matrix)
+    unique_scores = model.score_samples(unique_matrix)
+    model.offset_ = np.percentile(np.repeat(unique_scores, counts), 100.0 * RISK_CONTAMINATION)
+    return model, unique_scores - model.offset_
+
+
+# Submitted jobs not finished yet, so shutdown can cancel the queued ones
+_PROCESS_POOL = {"executor": None, "pending": set()}
+_PROCESS_POOL_LOCK = threading.Lock()
+
+
+def _get_process_pool():
+    with _PROCESS_POOL_LOCK:
+        if _PROCESS_POOL["executor"] is None:
+            # spawn, not fork: the API process has live threads and DB connections
+            _PROCESS_POOL["executor"] = ProcessPoolExecutor(
+                max_workers=RISK_POOL_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _PROCESS_POOL["executor"]
+
+
+def shutdown_risk_pool():
+    """Stop the worker processes (if process mode ever started them)"""
+    with _PROCESS_POOL_LOCK:
+        executor = _PROCESS_POOL["executor"]
+        _PROCESS_POOL["executor"] = None
+        pending = list(_PROCESS_POOL["pending"])
+    if executor is not None:
+        # shutdown(cancel_futures=True) needs Python 3.9; jobs already running can't be cancelled
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+
+def _forget_job(future):
+    with _PROCESS_POOL_LOCK:
+        _PROCESS_POOL["pending"].discard(future)
+
+
+def run_risk_job(fn, *args):
+    """Run a scoring job according to RISK_EXECUTION_MODE"""
+    return run_risk_jobs(fn, [args])[0]
+
+
+def run_risk_jobs(fn, arg_list):
+    """Run several scoring jobs, in parallel across the pool in process mode"""
+    if RISK_EXECUTION_MODE != "process":
+        return [fn(*args) for args in arg_list]
+
+    executor = _get_process_pool()
+    futures = [executor.submit(fn, *args) for args in arg_list]
+    pending = _PROCESS_POOL["pending"]
+    for future in futures:
+        with _PROCESS_POOL_LOCK:
+            pending.add(future)
+        future.add_done_callback(_forget_job)
+    try:
+        # Only this thread waits; it holds no GIL while the workers compute
+        return [future.result() for future in futures]
+    except BrokenProcessPool:
+        # A crashed worker poisons the pool; start a fresh one next time
+        with _PROCESS_POOL_LOCK:
+            if _PROCESS_POOL["executor"] is not None:
+                _PROCESS_POOL["executor"].shutdown(wait=False)
+            _PROCESS_POOL["executor"] = None
+        raise
+
+
+# =============== PERMISSION MATRIX ===============
+class PermissionMatrix:
+    """Sparse users x permissions matrix (1 = user holds the permission).
+
+    Users created from the same role templates share identical rows, so the
+    distinct rows are also kept (unique_matrix) together with how many users
+    have each one (counts) and which distinct row each user maps to (inverse).
+    """
+
+    def __init__(self, matrix, columns, user_ids, unique_matrix, inverse, counts):
+        self.matrix = matrix
+        self.columns = columns
+        self.column_index = {name: idx for idx, name in enumerate(columns)}
+        self.user_ids = user_ids
+        self.unique_matrix = unique_matrix
+        self.inverse = inverse
+        self.counts = counts
+
+    @classmethod
+    def from_users(cls, users):
+        """Build the CSR matrix straight from each user's accumulated_permissions"""
+        # Intern permission names into column indices once. Sorting keeps the
+        # column order (and so the fitted model) the same in every process.
+        columns = sorted({perm for user in users for perm in (user.accumulated_permissions or [])})
+        column_index = {name: idx for idx, name in enumerate(columns)}
+
+        indptr = [0]
+        indices = []
+        # Canonical (sorted) permission set -> distinct row number
+        unique_rows = {}
+        unique_indptr = [0]
+        unique_indices = []
+        counts = []
+        inverse = np.empty(len(users), dtype=np.intp)
+
+        for row_no, user in enumerate(users):
+            row = tuple(sorted({column_index[perm] for perm in (user.accumulated_permissions or [])}))
+            indices.extend(row)
+            indptr.append(len(indices))
+
+            unique_no = unique_rows.get(row)
+            if unique_no is None:
+                unique_no = unique_rows[row] = len(counts)
+                unique_indices.extend(row)
+                unique_indptr.append(len(unique_indices))
+                counts.append(0)
+            counts[unique_no] += 1
+            inverse[row_no] = unique_no
+
+        shape = (len(users), len(columns))
+        matrix = csr_matrix((np.ones(len(indices), dtype=np.float32), indices, indptr), shape=shape)
+        unique_matrix = csr_matrix(
+            (np.ones(len(unique_indices), dtype=np.float32), unique_indices, unique_indptr),
+            shape=(len(counts), len(columns))
+        )
+        return cls(matrix, columns, [user.id for user in users], unique_matrix, inverse,
+                   np.array(counts, dtype=np.intp))
+
+    def fingerprint(self):
+        """Digest of the distinct rows and their counts (same data, same digest)"""
+        digest = hashlib.sha1("\x1f".join(self.columns).encode())
+        for array in (self.unique_matrix.indptr, self.unique_matrix.indices, self.counts):
+            digest.update(np.ascontiguousarray(array, dtype=np.int64).tobytes())
+        return digest.hexdigest()
+
+
+# =============== EXPLAINABILITY ===============
+def permission_prevalence(matrix: PermissionMatrix):
+    """Share of users holding each permission, computed in one pass"""
+    n_users = matrix.matrix.shape[0]
+    if not n_users:
+        return np.zeros(len(matrix.columns))
+    return matrix.matrix.getnnz(axis=0) / n_users
+
+
+def prevalence_table(matrix: PermissionMatrix, prevalence):
+    """Prevalence per permission, rarest first"""
+    counts = matrix.matrix.getnnz(axis=0)
+    order = np.argsort(prevalence, kind="stable")
+    return [
+        {
+            "permission": matrix.columns[idx],
+            "users": int(counts[idx]),
+            "prevalence": round(float(prevalence[idx]), 4),
+            "rare": bool(prevalence[idx] < RARE_PERMISSION_THRESHOLD)
+        }
+        for idx in order
+    ]
+
+
+def explain_rare_permissions(matrix: PermissionMatrix, prevalence):
+    """Reason string per distinct matrix row: the rare permissions it holds"""
+    # Mask down to the rare columns once, then split the CSR row slices
+    rare_columns = np.flatnonzero(prevalence < RARE_PERMISSION_THRESHOLD)
+    rare = matrix.unique_matrix[:, rare_columns].tocsr()
+    rare.sort_indices()
+    names = np.array(matrix.columns, dtype=object)[rare_columns]
+
+    per_row = np.split(names[rare.indices], rare.indptr[1:-1])
+    return [", ".join(perms) if len(perms) else "Normal Usage" for perms in per_row]
+
+
+# =============== SCORING ===============
+def calculate_risk_scores(db: Session, update_db=False):
+    """Calculate risk scores using Isolation Forest"""
+    with _REFIT_LOCK:
+        return _calculate_snapshot(db, update_db)["scores"]
+
+
+def _calculate_snapshot(db: Session, update_db=False):
+    # Read the version before the users so a concurrent write can only
+    # make the snapshot look older than it is, never newer
+    version = get_data_version(db)
+    outcome = _calculate_risk_scores(db, version, update_db)
+    if outcome is not None:
+        snapshot = _make_snapshot(version, *outcome)
+        _swap_snapshot(snapshot)
+        return snapshot
+
+    users = db.query(UserPermissionModel).all()
+    # Return default scores if AI fails (not cached, so the next read retries)
+    return _make_snapshot(None, {user.id: {"risk_score": 0, "status": "✅ SAFE", "reason": "AI Error"}
+                                 for user in users}, [])
+
+
+def _calculate_risk_scores(db: Session, version, update_db=False):
+    users = db.query(UserPermissionModel).all()
+
+    matrix = PermissionMatrix.from_users(users) if users else None
+
+    if not users or not matrix.columns:
+        # Nothing to fit, but the stored scores and anomalies still have to
+        # follow (everyone may just have had their permissions removed)
+        result = {user.id: _risk_entry(0, "No permissions") for user in users}
+        if update_db:
+            write_back_scores(db, users, result)
+        return result, []
+
+    try:
+        # Run Isolation Forest model (it takes the sparse matrix as-is)
+        model_before = _RISK_CACHE["model"]
+        raw_scores = _fit_or_reuse_model(matrix, version)
+        refitted = _RISK_CACHE["model"] is not model_before
+
+        # Get reasons (permissions the user holds that few others do)
+        prevalence = permission_prevalence(matrix)
+        reasons = explain_rare_permissions(matrix, prevalence)
+
+        result = {}
+        if RISK_PARTITION_BY == "role":
+            user_scores, partitions_refitted = _score_role_partitions(users, matrix, raw_scores)
+            refitted = refitted or partitions_refitted
+            for idx, user in enumerate(users):
+                result[user.id] = _risk_entry(_to_risk_score(user_scores[idx]), reasons[matrix.inverse[idx]])
+        else:
+            # One entry per distinct permission set, fanned out to its users
+            entries = [_risk_entry(_to_risk_score(raw), reasons[idx]) for idx, raw in enumerate(raw_scores)]
+            for idx, user in enumerate(users):
+                result[user.id] = entries[matrix.inverse[idx]]
+
+        if refitted:
+            save_risk_model()
+
+    except Exception as e:
+        print(f"AI calculation error: {e}")
+        return None
+
+    # Update database if requested
+    if update_db:
+        write_back_scores(db, users, result)
+
+    return result, prevalence_table(matrix, prevalence)
+
+
+def _score_role_partitions(users, matrix, global_scores):
+    """Raw score per user from their role's own model (and whether any role was refitted).
+
+    Each role with enough users gets an independent model; a role whose
+    permission data is unchanged since the last run keeps its model, so a
+    change in one role never refits another. Smaller roles keep the global
+    model's scores.
+    """
+    user_scores = np.asarray(global_scores)[matrix.inverse]
+
+    rows_by_role = {}
+    for idx, user in enumerate(users):
+        rows_by_role.setdefault(user.current_role, []).append(idx)
+
+    previous = _RISK_CACHE["partitions"]
+    jobs = []
+    for role, rows in rows_by_role.items():
+        if len(rows) < RISK_MIN_PARTITION_SIZE:
+            continue
+        part = PermissionMatrix.from_users([users[idx] for idx in rows])
+        if not part.columns:
+            continue
+        fingerprint = part.fingerprint()
+        reuse = None
+        if role in previous and previous[role]["fingerprint"] == fingerprint:
+            reuse = previous[role]["model"]
+        jobs.append((role, rows, part, fingerprint, reuse))
+
+    # Partitions are fitted side by side across the worker pool
+    outcomes = run_risk_jobs(fit_and_score, [
+        (part.matrix if reuse is None else None, part.unique_matrix, part.counts, reuse, RISK_N_JOBS)
+        for role, rows, part, fingerprint, reuse in jobs
+    ])
+
+    partitions = {}
+    for (role, rows, part, fingerprint, reuse), (model, raw_scores) in zip(jobs, outcomes):
+        user_scores[rows] = raw_scores[part.inverse]
+        partitions[role] = {
+            "fingerprint": fingerprint,
+            "model": model,
+            "columns": part.columns,
+            "column_index": part.column_index
+        }
+    _RISK_CACHE["partitions"] = partitions
+    return user_scores, any(reuse is None for *_, reuse in jobs)
+
+
+def _to_risk_score(raw_score):
+    # Map the forest's decision function onto 0-100 (anomalies go up)
+    return round((0.5 - raw_score) * 100, 1)
+
+
+def risk_tier(risk_score):
+    """Dashboard tier (low/medium/high/critical) for a risk score"""
+    for floor, tier in RISK_TIERS:
+        if risk_score >= floor:
+            return tier
+    return "low"
+
+
+def _risk_entry(risk_score, reason):
+    risk_score = max(0, min(100, risk_score))  # Clamp to 0-100
+    return {
+        "risk_score": risk_score,
+        "status": "⚠️ DANGER" if risk_score > RISK_DANGER_THRESHOLD else "✅ SAFE",
+        "reason": reason
+    }
+
+
+# =============== INCREMENTAL SCORING ===============
+def score_user(db: Session, user: UserPermissionModel):
+    """Score one user whose permissions just changed and store the new risk score.
+
+    The user's vector is scored with the current model instead of refitting
+    everyone. Call after the write (and its data version bump) is committed.
+    """
+    return score_users(db, [user])[user.id]
+
+
+def score_users(db: Session, users):
+    """score_user for users changed together by one write (one data version bump).
+
+    Users sharing a model are scored in a single call. Returns a risk entry
+    per user id.
+    """
+    version = get_data_version(db)
+    model_state = _RISK_CACHE["model"]
+    snapshot = _RISK_CACHE["snapshot"]
+
+    # Nothing scored yet: there is no baseline to score against
+    if model_state is None or snapshot is None:
+        result = calculate_risk_scores(db, update_db=True)
+        return {user.id: result.get(user.id, _risk_entry(0, "Normal Usage")) for user in users}
+
+    # Too many writes since the last fit: refit the whole population
+    if version - model_state["version"] >= RISK_REFIT_EVERY:
+        if not risk_service.running:
+            result = calculate_risk_scores(db, update_db=True)
+            return {user.id: result.get(user.id, _risk_entry(0, "Normal Usage")) for user in users}
+        risk_service.request_refresh()
+
+    # Users in a role with its own model are scored against that baseline
+    groups = {}
+    for user in users:
+        state = model_state
+        if RISK_PARTITION_BY == "role" and user.current_role in _RISK_CACHE["partitions"]:
+            state = _RISK_CACHE["partitions"][user.current_role]
+        groups.setdefault(id(state), (state, []))[1].append(user)
+
+    entries = {}
+    for state, group in groups.values():
+        column_index = state["column_index"]
+        indices, indptr = [], [0]
+        for user in group:
+            # Permissions the model has never seen are left out of the vector
+            # until the next refit, but they are still reported as rare
+            indices.extend(sorted(
+                column_index[perm] for perm in set(user.accumulated_permissions or []) if perm in column_index
+            ))
+            indptr.append(len(indices))
+        vectors = csr_matrix(
+            (np.ones(len(indices), dtype=np.float32), indices, indptr),
+            shape=(len(group), len(state["columns"]))
+        )
+        raw_scores = state["model"].decision_function(vectors)
+        for user, raw_score in zip(group, raw_scores):
+            rare = sorted(set(user.accumulated_permissions or []) - snapshot["common_permissions"])
+            entries[user.id] = _risk_entry(_to_risk_score(raw_score), ", ".join(rare) if rare else "Normal Usage")
+
+    excess_counts = get_role_catalog().excess_counts(users)
+    now = datetime.datetime.utcnow()
+    for user, excess_perms in zip(users, excess_counts):
+        entry = entries[user.id]
+        user.risk_score = entry["risk_score"]
+        user.risk_tier = risk_tier(entry["risk_score"])
+        user.excess_permissions = excess_perms
+        user.last_scored_at = now
+    opened, resolved = sync_user_anomalies(db, users, entries)
+    # Read before the commit expires the instances (one SELECT each after it)
+    deltas = [
+        {"id": user.id, "username": user.username, "risk_score": user.risk_score, "risk_tier": user.risk_tier}
+        for user in users
+    ]
+    bump_scores_version(db)
+    db.commit()
+    publish_score_changes(deltas, opened, resolved)
+
+    with _RISK_CACHE_LOCK:
+        snapshot = _RISK_CACHE["snapshot"]
+        # Patch the table if it was current right before this write; the
+        # patched copy replaces it so readers of the old table are undisturbed
+        if snapshot["version"] == version - 1:
+            scores = dict(snapshot["scores"])
+            scores.update(entries)
+            _RISK_CACHE["snapshot"] = dict(snapshot, scores=scores, version=version)
+        elif risk_service.running:
+            risk_service.request_refresh()
+
+    return entries
+
+
+# =============== WRITE-BACK ===============
+def write_back_scores(db: Session, users, result):
+    """Persist the scores, tiers, excess counts and anomalies that changed, in a single transaction"""
+    excess_counts = get_role_catalog().excess_counts(users)
+
+    now = datetime.datetime.utcnow()
+    changed = []
+    for user, excess_perms in zip(users, excess_counts):
+        if user.id not in result:
+            continue
+        row = {
+            "id": user.id,
+            "risk_score": result[user.id]["risk_score"],
+            "risk_tier": risk_tier(result[user.id]["risk_score"]),
+            "excess_permissions": excess_perms
+        }
+        if (user.risk_score, user.risk_tier, user.excess_permissions) != \
+                (row["risk_score"], row["risk_tier"], row["excess_permissions"]):
+            changed.append(dict(row, last_scored_at=now))
+
+    if changed:
+        # ORM bulk UPDATE by primary key: one executemany
+        db.execute(update(UserPermissionModel), changed)
+    # Unchanged rows keep their stamp (the run itself is DataVersion.scored_at),
+    # except users seen for the first time, whose defaults happened to match
+    db.execute(
+        update(UserPermissionModel).where(UserPermissionModel.last_scored_at.is_(None)).values(last_scored_at=now)
+    )
+    opened, resolved = sync_anomalies(db, users, result)
+    # Read before the commit expires the instances (one SELECT each after it)
+    usernames = {user.id: user.username for user in users}
+    deltas = [dict(row, username=usernames[row["id"]]) for row in changed]
+    bump_scores_version(db)
+    db.commit()
+
+    publish_score_changes(deltas, opened, resolved)
+    return len(changed)
+
+
+# =============== CHANGE EVENTS ===============
+def publish_score_changes(changed, opened, resolved):
+    """Tell stream subscribers about committed score and anomaly changes.
+
+    Sends one "scores" and one "anomalies" event per commit, or a single
+    "rescored" event when a refit moved too many users for deltas to help.
+    """
+    if not (changed or opened or resolved):
+        return
+    if len(changed) + len(opened) + len(resolved) > EVENT_MAX_USER_DELTAS:
+        event_broker.publish("rescored", {
+            "users_changed": len(changed),
+            "anomalies_opened": len(opened),
+            "anomalies_resolved": len(resolved)
+        })
+        return
+
+    if changed:
+        event_broker.publish("scores", {"users": [
+            {"id": row["id"], "user": row["username"], "riskScore": row["risk_score"], "status": row["risk_tier"]}
+            for row in changed
+        ]})
+    if opened or resolved:
+        event_broker.publish("anomalies", {
+            "opened": [
+                {"userId": row["user_id"], "user": row["username"], "severity": row["severity"],
+                 "system": row["system"], "riskScore": row["risk_score"]}
+                for row in opened
+            ],
+            "resolved": [{"id": row.id, "userId": row.user_id, "user": row.username} for row in resolved]
+        })
+
+
+# =============== BACKGROUND RECALCULATION ===============
+class RiskRecalculationService:
+    """Background thread that owns full refits.
+
+    Write events only request a refresh; bursts of requests are coalesced
+    into one refit, and the new score table is swapped in when it is ready
+    while readers keep being served the previous one.
+    """
+
+    def __init__(self, coalesce_seconds=RISK_COALESCE_SECONDS, refresh_interval=RISK_REFRESH_INTERVAL):
+        self.coalesce_seconds = coalesce_seconds
+        self.refresh_interval = refresh_interval
+        self.refitting = False
+        self.last_refit_at = None
+        self.last_refit_seconds = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="risk-recalculation", daemon=True)
+        self._thread.start()
+        # Warm the score table right away instead of on the first read
+        self.request_refresh()
+
+    def stop(self, timeout=10):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def request_refresh(self):
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            # The timeout doubles as the periodic refit timer
+            self._wake.wait(self.refresh_interval)
+            if self._stop.is_set():
+                break
+
+            # Coalesce: keep waiting while requests keep arriving (bounded)
+            deadline = time.time() + self.coalesce_seconds * 10
+            self._wake.clear()
+            while time.time() < deadline and self._wake.wait(self.coalesce_seconds):
+                self._wake.clear()
+                if self._stop.is_set():
+                    return
+
+            try:
+                self._refresh()
+            except Exception as e:
+                print(f"Background risk recalculation error: {e}")
+
+    def _refresh(self):
+        db = SessionLocal()
+        try:
+            version = get_data_version(db)
+            snapshot = _RISK_CACHE["snapshot"]
+            model_state = _RISK_CACHE["model"]
+            # Up to date: the table is current and came from a model fitted on it
+            if (snapshot is not None and snapshot["version"] == version
+                    and model_state is not None and model_state["version"] == version):
+                return
+
+            self.refitting = True
+            started = time.time()
+            calculate_risk_scores(db, update_db=True)
+            self.last_refit_at = time.time()
+            self.last_refit_seconds = self.last_refit_at - started
+        finally:
+            self.refitting = False
+            db.close()
+
+
+risk_service = RiskRecalculationService()
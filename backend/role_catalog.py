@@ -0,0 +1,129 @@
+from backend.database import SessionLocal
+from backend.models import PermissionModel
+from backend.permission_store import get_permission_ids
+import json
+import numpy as np
+import os
+import threading
+
+# Role -> entitled permissions. Loaded once per process; restart to pick up edits.
+ROLE_CATALOG_PATH = os.getenv(
+    "ROLE_CATALOG_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "roles.json")
+)
+
+# Set bits in every byte value, for popcounts over packed bitsets
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+# =============== ROLE CATALOG ===============
+_ROLE_CATALOG = {"catalog": None}
+_ROLE_CATALOG_LOCK = threading.Lock()
+
+
+def load_role_definitions(path=ROLE_CATALOG_PATH):
+    """Read the role -> permissions mapping from the catalog file"""
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def get_role_catalog():
+    """Get the compiled role catalog, compiling it on first use"""
+    catalog = _ROLE_CATALOG["catalog"]
+    if catalog is None:
+        with _ROLE_CATALOG_LOCK:
+            catalog = _ROLE_CATALOG["catalog"]
+            if catalog is None:
+                catalog = RoleCatalog(load_role_definitions())
+                _ROLE_CATALOG["catalog"] = catalog
+    return catalog
+
+
+class RoleCatalog:
+    """Role entitlements compiled to bitsets over the interned permission ids.
+
+    Bit i of a bitset is permission id i from the permissions table. Row
+    len(roles) is an empty entitlement used for roles missing from the
+    catalog, so every permission such a user holds counts as excess.
+    """
+
+    def __init__(self, roles):
+        self.roles = {role: list(perms) for role, perms in roles.items()}
+        self.role_index = {role: i for i, role in enumerate(self.roles)}
+        self._ids_lock = threading.Lock()
+        self._compile()
+
+    def _compile(self):
+        """Load the permission ids and build the role bitsets over them.
+
+        Both come from a session of their own: role permissions are interned
+        and committed there, so a caller that rolls back cannot leave ids in
+        the bitsets that the database later hands to other permissions. Ids
+        and bitsets are swapped in together, so they always agree.
+        """
+        db = SessionLocal()
+        try:
+            get_permission_ids(db, {perm for perms in self.roles.values() for perm in perms})
+            db.commit()
+            permission_ids = dict(db.query(PermissionModel.name, PermissionModel.id).all())
+        finally:
+            db.close()
+
+        width = max(permission_ids.values(), default=0) + 1
+        bits = np.zeros((len(self.roles) + 1, width), dtype=bool)
+        for role, perms in self.roles.items():
+            bits[self.role_index[role], [permission_ids[perm] for perm in perms]] = True
+        self._compiled = (permission_ids, np.packbits(bits, axis=1))
+
+    def names(self):
+        """Role names in catalog order"""
+        return list(self.roles)
+
+    def permissions(self, role):
+        """Permissions a role is entitled to (empty for unknown roles)"""
+        return self.roles.get(role, [])
+
+    def excess_counts(self, users):
+        """Count each user's permissions outside their role in one AND-NOT + popcount.
+
+        Returns a list aligned with users.
+        """
+        if not users:
+            return []
+
+        perm_lists = [user.accumulated_permissions or [] for user in users]
+        names = {perm for perms in perm_lists for perm in perms}
+
+        # Permissions created since the catalog was compiled
+        ids, entitlements = self._compiled
+        if not names <= ids.keys():
+            with self._ids_lock:
+                if self._compiled[0] is ids:
+                    self._compile()
+            ids, entitlements = self._compiled
+        # Anything still unknown sits past the last id, outside every role
+        extra = {name: max(ids.values(), default=0) + 1 + i for i, name in enumerate(sorted(names - ids.keys()))}
+
+        lengths = np.fromiter((len(perms) for perms in perm_lists), dtype=np.int64, count=len(users))
+        cols = np.fromiter(
+            (ids[perm] if perm in ids else extra[perm] for perms in perm_lists for perm in perms),
+            dtype=np.int64, count=int(lengths.sum())
+        )
+        rows = np.repeat(np.arange(len(users)), lengths)
+
+        # Set bits straight into the packed rows (packbits order: bit 0 is the high bit)
+        width = max((int(cols.max()) >> 3) + 1 if len(cols) else 0, entitlements.shape[1])
+        held = np.zeros((len(users), width), dtype=np.uint8)
+        np.bitwise_or.at(held, (rows, cols >> 3), (0x80 >> (cols & 7)).astype(np.uint8))
+
+        if entitlements.shape[1] < held.shape[1]:
+            entitlements = np.pad(entitlements, ((0, 0), (0, held.shape[1] - entitlements.shape[1])))
+
+        unknown = len(self.roles)
+        role_rows = np.fromiter(
+            (self.role_index.get(user.current_role, unknown) for user in users), dtype=np.int64, count=len(users)
+        )
+        excess = held & ~entitlements[role_rows]
+        return _POPCOUNT[excess].sum(axis=1, dtype=np.int64).tolist()
+
+    def excess_count(self, user):
+        """Excess permission count for a single user"""
+        return self.excess_counts([user])[0]
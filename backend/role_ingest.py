@@ -0,0 +1,88 @@
+from sqlalchemy.orm import Session
+from backend.database import SessionLocal, bump_data_version
+from backend.models import UserPermissionModel
+from backend.permission_store import set_users_permissions
+from backend.risk_engine import calculate_risk_scores, risk_service
+import os
+
+# Role changes applied per transaction by bulk ingestion
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "1000"))
+
+
+# =============== BATCHES ===============
+def apply_role_changes(db: Session, changes, source="update-role-bulk"):
+    """Upsert a batch of role changes with /update-role's creep semantics (does not commit).
+
+    New users are created, the new role replaces the old one and the new
+    permissions are added to the ones already held. A username repeated in
+    the batch has its changes applied in order. Risk scores are left alone.
+    Returns one result per change.
+    """
+    names = {change.username for change in changes}
+    users = {
+        user.username: user
+        for user in db.query(UserPermissionModel).filter(UserPermissionModel.username.in_(names))
+    }
+
+    pending = {}
+    results = []
+    for change in changes:
+        user = users.get(change.username)
+        created = user is None
+        if created:
+            user = UserPermissionModel(username=change.username, current_role="New Hire", accumulated_permissions=[])
+            db.add(user)
+            users[change.username] = user
+
+        held = pending.get(change.username, set(user.accumulated_permissions or []))
+        added = set(change.new_permissions) - held
+        pending[change.username] = held | added
+
+        role_changed = user.current_role != change.new_role
+        user.current_role = change.new_role
+        results.append({
+            "username": change.username,
+            "status": "created" if created else "updated" if added or role_changed else "unchanged",
+            "role": change.new_role,
+            "permissions_added": sorted(added),
+            "total_permissions": len(pending[change.username])
+        })
+
+    set_users_permissions(db, [(users[name], held) for name, held in pending.items()], source)
+    if any(result["status"] != "unchanged" for result in results):
+        bump_data_version(db)
+    return results
+
+
+def ingest_role_changes(changes, source="update-role-bulk"):
+    """Apply one batch in its own session and transaction.
+
+    A failed batch is rolled back as a whole and every change in it is
+    reported as an error.
+    """
+    db = SessionLocal()
+    try:
+        results = apply_role_changes(db, changes, source)
+        db.commit()
+        return results
+    except Exception as e:
+        db.rollback()
+        print(f"Bulk role change batch failed: {e}")
+        return [{"username": change.username, "status": "error", "error": str(e)} for change in changes]
+    finally:
+        db.close()
+
+
+# =============== RISK ===============
+def recalculate_after_ingest():
+    """Rescore once after a bulk load: queue a refit, or run it here without the background service"""
+    if risk_service.running:
+        risk_service.request_refresh()
+        return "queued"
+
+    db = SessionLocal()
+    try:
+        calculate_risk_scores(db, update_db=True)
+        return "completed"
+    finally:
+        db.close()
@@ -1,22 +1,21 @@
 import requests
 import random
+import json
+import os
 
 # The URL of your running FastAPI server
 # Try localhost if 127.0.0.1 failed
 # Change this line:
-API_URL = "https://access-guardian.onrender.com/update-role"
+API_URL = "https://access-guardian.onrender.com/update-role/bulk"
 
-# Sample roles and their specific permissions
-ROLES = {
-    "HR": ["view_salaries", "edit_profiles", "onboard_users"],
-    "Developer": ["access_github", "deploy_code", "read_logs"],
-    "Finance": ["process_payments", "view_tax_data", "approve_expenses"],
-    "DevOps": ["db_admin", "server_root", "manage_cloud"]
-}
+# Roles and their specific permissions, from the role catalog
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "roles.json"), "r", encoding="utf-8") as f:
+    ROLES = json.load(f)
 
 def seed_users():
     print("🚀 Starting Team Obsidian Data Seeder...")
     
+    payloads = []
     for i in range(1, 51):
         username = f"user_{i}"
         
@@ -29,19 +28,25 @@ def seed_users():
         final_role = random.choice(list(ROLES.keys()))
         final_perms = ROLES[final_role]
         
-        payload = {
+        payloads.append({
             "username": username,
             "new_role": final_role,
             "new_permissions": final_perms
-        }
-        
-        # Send to your API
-        response = requests.post(API_URL, json=payload)
-        
-        if response.status_code == 200:
-            print(f"✅ Created {username}: Moved to {final_role} (Creep active)")
+        })
+    
+    # Send everyone to your API in one NDJSON request
+    body = "\n".join(json.dumps(payload) for payload in payloads)
+    response = requests.post(API_URL, data=body.encode("utf-8"), headers={"Content-Type": "application/x-ndjson"})
+    
+    if response.status_code != 200:
+        print(f"❌ Bulk load failed: {response.status_code}")
+        return
+    
+    for result in response.json()["results"]:
+        if result["status"] == "error":
+            print(f"❌ Failed to create {result.get('username', result['index'])}: {result['error']}")
         else:
-            print(f"❌ Failed to create {username}")
+            print(f"✅ {result['status'].capitalize()} {result['username']}: Moved to {result['role']} (Creep active)")
 
 if __name__ == "__main__":
     seed_users()
\ No newline at end of file
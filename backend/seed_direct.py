@@ -1,5 +1,8 @@
-from database import SessionLocal, init_db
-from models import UserPermissionModel
+# Run from the repository root: python -m backend.seed_direct
+from backend.database import SessionLocal, init_db, bump_data_version
+from backend.permission_store import rebuild_permission_grants
+from backend.role_catalog import load_role_definitions
+from backend.models import UserPermissionModel
 import random
 import json
 from datetime import datetime, timedelta
@@ -7,13 +10,8 @@ from datetime import datetime, timedelta
 # Initialize database (if not already)
 init_db()
 
-# Sample roles and permissions
-ROLES = {
-    "HR": ["view_salaries", "edit_profiles", "onboard_users"],
-    "Developer": ["access_github", "deploy_code", "read_logs"],
-    "Finance": ["process_payments", "view_tax_data", "approve_expenses"],
-    "DevOps": ["db_admin", "server_root", "manage_cloud"]
-}
+# Roles and permissions from the role catalog
+ROLES = load_role_definitions()
 
 def seed_users():
     print("🚀 Seeding database directly...")
@@ -54,7 +52,12 @@ def seed_users():
             db.add(user)
             print(f"✅ {username}: {current_role} with {len(all_permissions)} permissions")
         
+        # Invalidate cached risk scores in any running API process
+        bump_data_version(db)
         db.commit()
+        
+        # Users were written directly, so rebuild the normalized grants
+        rebuild_permission_grants(db)
         print(f"\n🎉 Seeded {20} users successfully!")
         
         # Display sample
@@ -0,0 +1,116 @@
+from fastapi import Response
+from starlette.middleware.gzip import GZipMiddleware
+import datetime
+import json
+import os
+
+try:
+    import orjson
+except ImportError:  # optional: the stdlib encoder is used without it
+    orjson = None
+
+# Responses smaller than this are not worth compressing
+GZIP_MINIMUM_SIZE = int(os.getenv("GZIP_MINIMUM_SIZE", "1000"))
+
+# Layouts for list endpoints: a list of objects, or one array per field
+LIST_FORMATS = ("rows", "columnar")
+
+
+# =============== ENCODING ===============
+def _default(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def dumps(content):
+    """JSON bytes for plain dicts/lists/scalars, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+class FastJSONResponse(Response):
+    """JSON response encoded by dumps (orjson when available)"""
+    media_type = "application/json"
+
+    def render(self, content):
+        return dumps(content)
+
+
+def json_response(content, response: Response = None):
+    """FastJSONResponse carrying the headers already set on the endpoint's Response.
+
+    Returning a Response directly skips response_model validation, but it
+    also drops headers that dependencies put on the injected one (ETag,
+    X-Next-Cursor), so they are copied over.
+    """
+    headers = {}
+    if response is not None:
+        headers = {
+            key: value for key, value in response.headers.items()
+            if key not in ("content-length", "content-type")
+        }
+    return FastJSONResponse(content, headers=headers)
+
+
+# =============== LIST LAYOUTS ===============
+def parse_fields(fields, allowed):
+    """Field names from a ?fields=a,b parameter (ValueError for unknown ones, None for all)"""
+    if not fields:
+        return None
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in names if name not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return names
+
+
+def shape_rows(rows, fields, layout="rows"):
+    """Project row dicts onto fields (all when None) and lay them out as rows or columns"""
+    if layout not in LIST_FORMATS:
+        raise ValueError(f"Unknown format: {layout}")
+    if fields is None:
+        fields = list(rows[0]) if rows else []
+
+    if layout == "columnar":
+        return {
+            "fields": fields,
+            "count": len(rows),
+            "columns": {field: [row[field] for row in rows] for field in fields}
+        }
+    if not rows or fields == list(rows[0]):
+        return rows
+    return [{field: row[field] for field in fields} for row in rows]
+
+
+# =============== COMPRESSION ===============
+class CompressionMiddleware:
+    """GZip for responses the client accepts it for, except event streams.
+
+    Event streams are passed through untouched (a compressor would hold
+    events back), and the ETag of a compressed body is made weak, since
+    it is no longer byte-identical to the uncompressed one.
+    """
+
+    def __init__(self, app, minimum_size=GZIP_MINIMUM_SIZE, skip_paths=()):
+        self.app = app
+        self.gzip = GZipMiddleware(app, minimum_size=minimum_size)
+        self.skip_paths = set(skip_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.skip_paths:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_weak_etag(message):
+            if message["type"] == "http.response.start":
+                headers = message.get("headers", [])
+                if any(key == b"content-encoding" for key, _ in headers):
+                    message["headers"] = [
+                        (key, b"W/" + value if key == b"etag" and not value.startswith(b"W/") else value)
+                        for key, value in headers
+                    ]
+            await send(message)
+
+        await self.gzip(scope, receive, send_with_weak_etag)
@@ -585,6 +585,10 @@ const Dashboard = ({ onLogout }) => {
     compliance_score: 92
   });
   const [anomalies, setAnomalies] = useState([]);
+  // Cursor for the flagged anomalies after the dashboard's first few
+  const [anomaliesCursor, setAnomaliesCursor] = useState(null);
+  // First page of users from the dashboard snapshot, handed to UserTable
+  const [usersPage, setUsersPage] = useState(null);
   
   // New state variables for QuickActions
   const [showAlertsModal, setShowAlertsModal] = useState(false);
@@ -599,6 +603,21 @@ const Dashboard = ({ onLogout }) => {
     }
   }, [demoMode]);
   
+  // In live mode the backend pushes score and anomaly changes; reload the
+  // dashboard once a burst of them settles instead of polling
+  useEffect(() => {
+    if (demoMode) return;
+    let reloadTimer = null;
+    const unsubscribe = api.subscribeToChanges(() => {
+      clearTimeout(reloadTimer);
+      reloadTimer = setTimeout(fetchRealData, 1000);
+    });
+    return () => {
+      clearTimeout(reloadTimer);
+      unsubscribe();
+    };
+  }, [demoMode]);
+  
   const checkBackendConnection = async () => {
     try {
       const connected = await checkBackendHealth();
@@ -615,12 +634,12 @@ const Dashboard = ({ onLogout }) => {
   const fetchRealData = async () => {
     try {
       console.log('Fetching real data from backend...');
-      const [statsData, anomaliesData] = await Promise.all([
-        api.getStats(),
-        api.getAnomalies()
-      ]);
-      setStats(statsData);
-      setAnomalies(anomaliesData);
+      // One request for everything the dashboard shows on load
+      const dashboard = await api.getDashboard();
+      setStats(dashboard.stats);
+      setAnomalies(dashboard.anomalies);
+      setAnomaliesCursor(dashboard.anomalies_next_cursor);
+      setUsersPage({ items: dashboard.users, nextCursor: dashboard.next_cursor });
       console.log('Data fetched successfully');
     } catch (error) {
       console.error('Failed to fetch real data, switching to demo mode:', error);
@@ -633,6 +652,7 @@ const Dashboard = ({ onLogout }) => {
         compliance_score: 92
       });
       setAnomalies(await api.getMockAnomalies());
+      setAnomaliesCursor(null);
     }
   };
   
@@ -687,7 +707,7 @@ ${result.recommendations.length > 0 ? `\nRecommendations: ${result.recommendatio
       case 'filter':
         // Show filtered high-risk users
         setFilteredUsers(data.users);
-        alert(`✅ Showing ${data.users?.length || 0} high-risk users (risk ≥ 60)`);
+        alert(`✅ Showing ${data.users?.length || 0} of ${data.count ?? data.users?.length ?? 0} high-risk users (risk ≥ 60)`);
         break;
       
       case 'showAlerts':
@@ -1027,7 +1047,7 @@ ${result.recommendations.length > 0 ? `\nRecommendations: ${result.recommendatio
                   </div>
                 )}
               </div>
-              <UserTable demoMode={demoMode} filteredUsers={filteredUsers} />
+              <UserTable demoMode={demoMode} filteredUsers={filteredUsers} initialPage={usersPage} />
             </div>
             
             {/* Permission Trend Chart */}
@@ -1056,7 +1076,12 @@ ${result.recommendations.length > 0 ? `\nRecommendations: ${result.recommendatio
                   {demoMode ? 'Demo' : 'Live'}
                 </span>
               </div>
-              <AnomaliesList anomalies={anomalies} demoMode={demoMode} />
+              <AnomaliesList
+                anomalies={anomalies}
+                nextCursor={anomaliesCursor}
+                demoMode={demoMode}
+                onRefresh={fetchRealData}
+              />
               <button 
                 onClick={() => {
                   if (demoMode) {
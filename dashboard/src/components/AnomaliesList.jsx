@@ -2,37 +2,59 @@ import { AlertTriangle, Clock, User, Database, Server, CreditCard, FileText, Act
 import { useState, useEffect } from 'react';
 import { api } from '../services/api';
 
-const AnomaliesList = ({ demoMode = true, anomalies: propAnomalies }) => {
+// Live mode renders the anomalies the dashboard snapshot came with (so the
+// list matches the counter and follows its reloads); only "Load more" asks
+// the API for the flagged anomalies after them. Demo mode loads mock data.
+const AnomaliesList = ({ demoMode = true, anomalies: propAnomalies, nextCursor: propNextCursor, onRefresh }) => {
   const [anomalies, setAnomalies] = useState([]);
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState(null);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
 
   useEffect(() => {
-    fetchAnomalies();
+    if (demoMode) {
+      fetchMockAnomalies();
+    }
   }, [demoMode]);
 
-  const fetchAnomalies = async () => {
+  useEffect(() => {
+    if (!demoMode) {
+      setAnomalies(propAnomalies || []);
+      setNextCursor(propNextCursor || null);
+      setError(null);
+    }
+  }, [demoMode, propAnomalies, propNextCursor]);
+
+  const fetchMockAnomalies = async () => {
     setLoading(true);
     setError(null);
+    setNextCursor(null);
     try {
-      let data;
-      if (demoMode) {
-        data = await api.getMockAnomalies();
-      } else {
-        data = await api.getAnomalies();
-      }
-      setAnomalies(data);
+      setAnomalies(await api.getMockAnomalies());
     } catch (err) {
       console.error('Error fetching anomalies:', err);
-      setError('Failed to load anomalies. Using demo data.');
-      // Fallback to mock data
-      const mockData = await api.getMockAnomalies();
-      setAnomalies(mockData);
+      setError('Failed to load demo anomalies.');
     } finally {
       setLoading(false);
     }
   };
 
+  const loadMoreAnomalies = async () => {
+    if (!nextCursor) return;
+    setLoadingMore(true);
+    try {
+      const page = await api.getAllAnomalies(nextCursor, 50, { flagged: true });
+      setAnomalies(prev => [...prev, ...page.anomalies]);
+      setNextCursor(page.next_cursor);
+    } catch (err) {
+      console.error('Error loading more anomalies:', err);
+      setError('Failed to load more anomalies.');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const getSeverityColor = (severity) => {
     switch(severity) {
       case 'Critical': return 'bg-red-500 text-white';
@@ -74,7 +96,12 @@ const AnomaliesList = ({ demoMode = true, anomalies: propAnomalies }) => {
   };
 
   const handleRefresh = () => {
-    fetchAnomalies();
+    if (demoMode) {
+      fetchMockAnomalies();
+    } else if (onRefresh) {
+      setError(null);
+      onRefresh();
+    }
   };
 
   if (loading) {
@@ -199,6 +226,18 @@ const AnomaliesList = ({ demoMode = true, anomalies: propAnomalies }) => {
         </div>
       ))}
       
+      {nextCursor && (
+        <div className="text-center">
+          <button 
+            onClick={loadMoreAnomalies}
+            disabled={loadingMore}
+            className="px-4 py-2 bg-gray-100 text-gray-700 rounded-lg hover:bg-gray-200 text-sm disabled:opacity-50"
+          >
+            {loadingMore ? 'Loading...' : 'Load more anomalies'}
+          </button>
+        </div>
+      )}
+      
       {anomalies.length > 0 && (
         <div className="pt-4 border-t">
           <div className="flex items-center text-sm text-gray-600">
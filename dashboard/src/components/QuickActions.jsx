@@ -84,10 +84,14 @@ Priya Patel,Finance Analyst,82,9`;
           onActionComplete('filter', { minRisk: 60, users: highRiskUsers });
         }
       } else {
-        const highRiskUsers = await api.filterUsers({ minRisk: 60 });
-        showMessage(`📊 Found ${highRiskUsers.length} high-risk users`, 'success');
+        const [{ count }, page] = await Promise.all([
+          api.countFilteredUsers({ minRisk: 60 }),
+          api.filterUsers({ minRisk: 60, sortBy: 'riskScore', sortOrder: 'desc' })
+        ]);
+        const highRiskUsers = page.items;
+        showMessage(`📊 Found ${count} high-risk users`, 'success');
         if (onActionComplete) {
-          onActionComplete('filter', { minRisk: 60, users: highRiskUsers });
+          onActionComplete('filter', { minRisk: 60, users: highRiskUsers, count });
         }
       }
     } catch (error) {
@@ -235,7 +239,7 @@ Priya Patel,Finance Analyst,82,9`;
           onActionComplete('showAlerts', { anomalies });
         }
       } else {
-        const data = await api.getAllAnomalies(1, 100);
+        const data = await api.getAllAnomalies(null, 100);
         showMessage(`🚨 Showing ${data.anomalies.length} of ${data.total} alerts`, 'success');
         if (onActionComplete) {
           onActionComplete('showAlerts', data);
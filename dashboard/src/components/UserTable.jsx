@@ -3,7 +3,7 @@ import { useState, useEffect } from 'react';
 import { api } from '../services/api';
 import RemediationModal from './RemediationModal';
 
-const UserTable = ({ demoMode = false }) => {
+const UserTable = ({ demoMode = false, initialPage }) => {
   const [users, setUsers] = useState([]);
   const [loading, setLoading] = useState(true);
   const [selectedUser, setSelectedUser] = useState(null);
@@ -20,9 +20,16 @@ const UserTable = ({ demoMode = false }) => {
   });
   const [activeFilters, setActiveFilters] = useState({});
   
+  // Keyset pagination: the cursor for the next page and the criteria it belongs to
+  const [nextCursor, setNextCursor] = useState(null);
+  const [pageCriteria, setPageCriteria] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
+  
   const fetchUsers = async (criteria = null) => {
     setLoading(true);
     setError(null);
+    setNextCursor(null);
+    setPageCriteria(criteria);
     try {
       let data;
       if (demoMode) {
@@ -38,13 +45,10 @@ const UserTable = ({ demoMode = false }) => {
           });
         }
       } else {
-        if (criteria) {
-          // Call filter endpoint
-          data = await api.filterUsers(criteria);
-        } else {
-          // Get all users
-          data = await api.getUsers();
-        }
+        // First page only; more are fetched on demand
+        const page = criteria ? await api.filterUsers(criteria) : await api.getUsers();
+        data = page.items;
+        setNextCursor(page.nextCursor);
       }
       setUsers(data);
     } catch (error) {
@@ -58,10 +62,42 @@ const UserTable = ({ demoMode = false }) => {
     }
   };
 
+  const loadMoreUsers = async () => {
+    if (!nextCursor) return;
+    setLoadingMore(true);
+    try {
+      const page = pageCriteria
+        ? await api.filterUsers(pageCriteria, nextCursor)
+        : await api.getUsers(nextCursor);
+      setUsers(prev => [...prev, ...page.items]);
+      setNextCursor(page.nextCursor);
+    } catch (error) {
+      console.error('Error loading more users:', error);
+      setError('Failed to load more users.');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   useEffect(() => {
+    // In live mode the dashboard snapshot brings the first page; without
+    // an initialPage prop the table fetches it itself
+    if (!demoMode && initialPage !== undefined) {
+      if (!initialPage) setLoading(true);
+      return;
+    }
     fetchUsers();
   }, [demoMode]);
 
+  useEffect(() => {
+    // Take each new snapshot page unless a filter is showing
+    if (demoMode || !initialPage || pageCriteria) return;
+    setUsers(initialPage.items);
+    setNextCursor(initialPage.nextCursor);
+    setError(null);
+    setLoading(false);
+  }, [initialPage, demoMode]);
+
   const handleFilter = async () => {
     // Prepare criteria
     const criteria = {};
@@ -485,6 +521,18 @@ const UserTable = ({ demoMode = false }) => {
         </table>
       </div>
 
+      {nextCursor && (
+        <div className="mt-4 text-center">
+          <button 
+            onClick={loadMoreUsers}
+            disabled={loadingMore}
+            className="px-4 py-2 bg-gray-100 text-gray-700 rounded-lg hover:bg-gray-200 text-sm disabled:opacity-50"
+          >
+            {loadingMore ? 'Loading...' : 'Load more users'}
+          </button>
+        </div>
+      )}
+
       <div className="mt-4 text-center text-sm text-gray-500">
         {Object.keys(activeFilters).length > 0 ? (
           <p>
@@ -496,7 +544,9 @@ const UserTable = ({ demoMode = false }) => {
             </button>
           </p>
         ) : (
-          <p>{users.length} users total. Use the filter button to narrow down results.</p>
+          <p>
+            {nextCursor ? `Showing the first ${users.length} users.` : `${users.length} users total.`} Use the filter button to narrow down results.
+          </p>
         )}
       </div>
 
@@ -79,14 +79,51 @@ export default {
   requestAccess,
 };
 
+// Bodies of earlier GETs with their ETag/Last-Modified, so a re-poll of
+// unchanged data is answered with an empty 304
+const MAX_CACHED_RESPONSES = 100;
+const responseCache = new Map();
+
+const conditionalGet = async (endpoint) => {
+  const url = `${API_BASE_URL}${endpoint}`;
+  const cached = responseCache.get(url);
+  const headers = {};
+  if (cached && cached.etag) headers['If-None-Match'] = cached.etag;
+  if (cached && cached.lastModified) headers['If-Modified-Since'] = cached.lastModified;
+  
+  const response = await fetch(url, { headers });
+  if (response.status === 304 && cached) {
+    return cached;
+  }
+  if (!response.ok) {
+    throw new Error(`API Error: ${response.status} ${response.statusText}`);
+  }
+  
+  const entry = {
+    body: await response.json(),
+    nextCursor: response.headers.get('X-Next-Cursor'),
+    etag: response.headers.get('ETag'),
+    lastModified: response.headers.get('Last-Modified')
+  };
+  responseCache.delete(url);
+  if (entry.etag || entry.lastModified) {
+    responseCache.set(url, entry);
+    // Drop the oldest entry (Maps keep insertion order)
+    if (responseCache.size > MAX_CACHED_RESPONSES) {
+      responseCache.delete(responseCache.keys().next().value);
+    }
+  }
+  return entry;
+};
+
 // Generic fetch wrapper
 const apiClient = {
-  get: async (endpoint) => {
-    const response = await fetch(`${API_BASE_URL}${endpoint}`);
-    if (!response.ok) {
-      throw new Error(`API Error: ${response.status} ${response.statusText}`);
-    }
-    return response.json();
+  get: async (endpoint) => (await conditionalGet(endpoint)).body,
+  
+  // Keyset-paginated GET: the next page's cursor comes back in X-Next-Cursor
+  getPage: async (endpoint) => {
+    const { body, nextCursor } = await conditionalGet(endpoint);
+    return { items: body, nextCursor };
   },
   
   post: async (endpoint, data) => {
@@ -104,14 +141,36 @@ const apiClient = {
   }
 };
 
+// Query string for one keyset page
+const pageParams = (cursor, limit, extra = {}) => {
+  const params = new URLSearchParams({ limit, ...extra });
+  if (cursor) params.set('cursor', cursor);
+  return params.toString();
+};
+
 // API endpoints
 export const api = {
   // ============= EXISTING ENDPOINTS =============
-  getUsers: () => apiClient.get('/api/users'),
+  // One page of users: { items, nextCursor }
+  getUsers: (cursor = null, limit = 50) => apiClient.getPage(`/api/users?${pageParams(cursor, limit)}`),
   
   // Dashboard stats
   getStats: () => apiClient.get('/api/stats'),
   
+  // Stats, first page of users and top anomalies in one request
+  getDashboard: (limit = 50) => apiClient.get(`/api/dashboard?limit=${limit}`),
+  
+  // Live score and anomaly changes over Server-Sent Events. The browser
+  // reconnects by itself and resumes from the last event it saw.
+  // Returns a function that closes the stream.
+  subscribeToChanges: (onChange) => {
+    const source = new EventSource(`${API_BASE_URL}/api/events/stream`);
+    ['scores', 'anomalies', 'rescored', 'reset'].forEach((type) => {
+      source.addEventListener(type, (event) => onChange(type, JSON.parse(event.data)));
+    });
+    return () => source.close();
+  },
+  
   // Anomalies
   getAnomalies: () => apiClient.get('/api/anomalies'),
   
@@ -132,23 +191,23 @@ export const api = {
     return response.blob(); // Returns file blob
   },
   
-  // Filter users by criteria
-  filterUsers: async (criteria) => {
+  // Filter users by criteria, one page at a time: { items, nextCursor }
+  filterUsers: async (criteria, cursor = null, limit = 50) => {
     const response = await fetch(`${API_BASE_URL}/api/users/filter`, {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify(criteria)
+      body: JSON.stringify({ ...criteria, cursor, limit })
     });
     if (!response.ok) throw new Error(`API Error: ${response.status}`);
-    return response.json();
+    return { items: await response.json(), nextCursor: response.headers.get('X-Next-Cursor') };
   },
   
-  // Get all anomalies (paginated)
-  getAllAnomalies: async (page = 1, limit = 50) => {
-    const response = await fetch(`${API_BASE_URL}/api/anomalies/all?page=${page}&limit=${limit}`);
-    if (!response.ok) throw new Error(`API Error: ${response.status}`);
-    return response.json();
-  },
+  // Count users matching the criteria (with a per-tier breakdown)
+  countFilteredUsers: (criteria) => apiClient.post('/api/users/filter/count', criteria),
+  
+  // Get anomalies one page at a time (pass back next_cursor for the next page)
+  getAllAnomalies: (cursor = null, limit = 50, filters = {}) =>
+    apiClient.get(`/api/anomalies/all?${pageParams(cursor, limit, filters)}`),
   
   // System health check
   runSystemHealthCheck: async () => {
@@ -15,15 +15,17 @@ raw_scores = model.decision_function(features)
 df['risk_score'] = [round((0.5 - s) * 100, 1) for s in raw_scores]
 
 # 4. EXPLAINABILITY: Find the "Suspect" permissions
-# We look for columns where the user has a '1' but the average is low
-def get_reason(row):
-    reasons = []
-    for col in features.columns:
-        if row[col] == 1 and features[col].mean() < 0.3:
-            reasons.append(col)
-    return ", ".join(reasons) if reasons else "Normal Usage"
+# We look for columns where the user has a '1' but the average is low.
+# Each column's average is computed once, then masked against every row.
+prevalence = features.mean()
+rare = features.loc[:, prevalence < 0.3].eq(1)
+if rare.shape[1]:
+    reasons = rare.dot(rare.columns + ", ").str[:-2]
+else:
+    # No rare permissions at all (the dot product would be integer zeros)
+    reasons = pd.Series("", index=df.index)
 
-df['reason'] = df.apply(get_reason, axis=1)
+df['reason'] = reasons.where(reasons != "", "Normal Usage")
 df['status'] = df['risk_score'].apply(lambda x: '⚠️ DANGER' if x > 65 else '✅ SAFE')
 
 print("\n--- TEAM OBSIDIAN: SMART PRIVILEGE AUDIT ---")